@@ -1,9 +1,23 @@
 #!/usr/bin/env python3
+import io
 import os
+import re
+import time
+import gzip
 import uuid
+import atexit
+import struct
+import tempfile
+import hashlib
+import random
 import sqlite3
+import threading
+import click
+from array import array
+from collections import OrderedDict
 from datetime import datetime
-from flask import Flask, request, render_template, redirect, url_for, abort, send_from_directory
+from flask import Flask, request, render_template, redirect, url_for, abort, send_from_directory, send_file, make_response, jsonify, g
+import metrics
 
 app = Flask(__name__)
 
@@ -12,13 +26,147 @@ SHARE_DB = "shares.db"
 SHARES_DIR = "shares"
 SCRIPTS_DIR = "scripts"
 
+# SQLite tuning for the per-thread connections
+DB_BUSY_TIMEOUT = 5.0               # seconds to wait for a writer's lock
+DB_CACHE_SIZE_KB = 8192             # page cache per connection
+DB_MMAP_SIZE = 64 * 1024 * 1024     # bytes of the database read through mmap
+DB_CACHED_STATEMENTS = 64           # prepared statements kept per connection
+
+# View counts are written in batches, at most this many seconds after the view...
+VIEW_COUNT_MAX_STALENESS = float(os.environ.get("VIEW_COUNT_MAX_STALENESS", "5"))
+# ...or as soon as this many views are waiting to be written
+VIEW_COUNT_FLUSH_THRESHOLD = int(os.environ.get("VIEW_COUNT_FLUSH_THRESHOLD", "500"))
+
+# Shares are stored gzip-compressed; trees compress 10-20x
+SHARE_GZIP_LEVEL = 9
+
+# Largest upload accepted by /api/share, in bytes; bigger ones get a 413
+SHARE_MAX_UPLOAD_BYTES = int(os.environ.get("SHARE_MAX_UPLOAD_BYTES", str(128 * 1024 * 1024)))
+
+# Share files live two directory levels down, named by the first hex digits
+# of their name (shares/ab/cd/abcd...), so no directory holds too many files
+SHARE_SHARD_LEVELS = 2
+
+# Shares held in memory, bounded by count and by total content size
+SHARE_CACHE_MAX_ENTRIES = int(os.environ.get("SHARE_CACHE_MAX_ENTRIES", "1024"))
+SHARE_CACHE_MAX_BYTES = int(os.environ.get("SHARE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Rendered share pages held in memory; a page is a little larger than its tree text
+PAGE_CACHE_MAX_ENTRIES = int(os.environ.get("PAGE_CACHE_MAX_ENTRIES", "256"))
+PAGE_CACHE_MAX_BYTES = int(os.environ.get("PAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Shares with more tree text than this are shown a directory at a time, fetched
+# from /api/tree/<share_id> as they are expanded, instead of in one <pre>
+VIEW_LAZY_THRESHOLD = int(os.environ.get("VIEW_LAZY_THRESHOLD", str(256 * 1024)))
+# Lines per /api/tree/<share_id> response
+TREE_PAGE_SIZE = 500
+TREE_MAX_PAGE_SIZE = 5000
+
+# Line indexes of the shares being viewed lazily, bounded by their estimated size
+OUTLINE_CACHE_MAX_ENTRIES = int(os.environ.get("OUTLINE_CACHE_MAX_ENTRIES", "64"))
+OUTLINE_CACHE_MAX_BYTES = int(os.environ.get("OUTLINE_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+
+# Shares can be given a lifetime in seconds (ttl) when uploaded, and are deleted
+# once it runs out. Shares older than SHARE_MAX_AGE seconds are deleted whatever
+# their ttl; 0 keeps shares without a ttl for good.
+SHARE_MAX_AGE = float(os.environ.get("SHARE_MAX_AGE", "0"))
+# Seconds between background sweeps for expired shares in each worker; 0 leaves
+# it to `flask --app app sweep-expired`
+SHARE_SWEEP_INTERVAL = float(os.environ.get("SHARE_SWEEP_INTERVAL", "300"))
+# Shares deleted per transaction, and seconds between transactions, so
+# uploads waiting on the write lock get in between
+SHARE_SWEEP_BATCH_SIZE = 200
+SHARE_SWEEP_PAUSE = 0.05
+
+# Longest ttl an upload may ask for, in seconds (ten years); larger values
+# are rejected rather than overflowing the expiry date
+SHARE_MAX_TTL = 10 * 365 * 24 * 3600
+
+# Seconds the storage totals of /api/storage and /metrics are reused for,
+# as summing them reads the whole blobs table; 0 sums them on every request
+STORAGE_TOTALS_TTL = float(os.environ.get("STORAGE_TOTALS_TTL", "10"))
+
+# Most shares accepted by one /api/shares request
+SHARE_BULK_MAX_SHARES = int(os.environ.get("SHARE_BULK_MAX_SHARES", "1000"))
+
+# Shares never change once created, so their raw text can be cached for good,
+# or, for a share that expires, until it does
+RAW_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Pages are revalidated on every visit so each one is still counted as a view
+VIEW_CACHE_CONTROL = "no-cache"
+
+# Part of the page ETags, so a changed template is not answered with 304
+with open(os.path.join(app.root_path, 'templates', 'view.html'), 'rb') as f:
+    VIEW_TEMPLATE_TAG = hashlib.sha1(f.read()).hexdigest()[:12]
+
+# /debug/profile samples a worker's stacks on request; off unless set, as it
+# shows the code and slows the worker while it runs
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "") == "1"
+PROFILER_MAX_SECONDS = 60
+
+# Werkzeug rejects a declared Content-Length over the limit before reading
+# the body, and stops a chunked upload as soon as it passes the limit
+app.config['MAX_CONTENT_LENGTH'] = SHARE_MAX_UPLOAD_BYTES
+# Werkzeug also caps the parts of one multipart body, at 1000 by default; a
+# full /api/shares request is that many files plus its other fields
+SHARE_MAX_FORM_PARTS = 2 * SHARE_BULK_MAX_SHARES + 16
+app.config['MAX_FORM_PARTS'] = SHARE_MAX_FORM_PARTS
+
 # Ensure directories exist
 os.makedirs(SHARES_DIR, exist_ok=True)
 os.makedirs(SCRIPTS_DIR, exist_ok=True)
 
+# Instrumentation, exposed at /metrics; each worker keeps its own
+registry = metrics.Registry()
+request_seconds = registry.register(metrics.Histogram(
+    "structure_request_seconds", "Time to handle a request, by route.", ('route', 'method')))
+requests_total = registry.register(metrics.Counter(
+    "structure_requests_total", "Requests handled, by route and status.", ('route', 'method', 'status')))
+stage_seconds = registry.register(metrics.Histogram(
+    "structure_stage_seconds", "Time spent in each stage of the share routes.", ('stage',)))
+upload_bytes = registry.register(metrics.Histogram(
+    "structure_upload_bytes", "Tree text per upload.", buckets=metrics.SIZE_BUCKETS))
+uploads_total = registry.register(metrics.Counter(
+    "structure_uploads_total", "Shares created, by whether their content was already stored.", ('content',)))
+views_flushed_total = registry.register(metrics.Counter(
+    "structure_views_flushed_total", "Views written to the database."))
+shares_expired_total = registry.register(metrics.Counter(
+    "structure_shares_expired_total", "Expired shares deleted by this worker's sweeps."))
+
+# One connection per thread, reused across requests
+_db_local = threading.local()
+
+def get_db():
+    """
+    Return this thread's database connection, opening it on first use.
+    
+    Connections are kept for the life of the thread, so their prepared
+    statements (cached by SQL text) are reused across requests. A connection
+    inherited from a parent process across a fork is never reused.
+    """
+    conn = getattr(_db_local, 'conn', None)
+    if conn is None or _db_local.pid != os.getpid():
+        with stage_seconds.time('db_connect'):
+            conn = open_db()
+        _db_local.conn = conn
+        _db_local.pid = os.getpid()
+    return conn
+
+def open_db():
+    """Open a tuned connection to the share database."""
+    conn = sqlite3.connect(SHARE_DB, timeout=DB_BUSY_TIMEOUT, cached_statements=DB_CACHED_STATEMENTS)
+    # WAL commits only need the log synced at checkpoints
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
 # Set up the database
 def setup_db():
-    conn = sqlite3.connect(SHARE_DB)
+    conn = get_db()
+    # Readers no longer wait for the view count writes; the mode is stored in the file
+    conn.execute("PRAGMA journal_mode=WAL")
     cursor = conn.cursor()
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS shares (
@@ -29,11 +177,626 @@ def setup_db():
         view_count INTEGER DEFAULT 0
     )
     ''')
+    # Stored content, one file per distinct upload, shared by every share with that content
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS blobs (
+        hash TEXT PRIMARY KEY,
+        file_path TEXT,
+        size INTEGER,
+        stored_size INTEGER,
+        refcount INTEGER DEFAULT 0
+    )
+    ''')
+    # Shares created before deduplication have their own file and no hash
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(shares)")]
+    if 'content_hash' not in columns:
+        cursor.execute("ALTER TABLE shares ADD COLUMN content_hash TEXT")
+    # Only shares uploaded with a ttl have an expiry time
+    if 'expires_at' not in columns:
+        cursor.execute("ALTER TABLE shares ADD COLUMN expires_at TIMESTAMP")
+    # The sweeps find expired shares through these, without scanning the table
+    cursor.execute("CREATE INDEX IF NOT EXISTS shares_created_at ON shares (created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS shares_expires_at ON shares (expires_at) WHERE expires_at IS NOT NULL")
     conn.commit()
-    conn.close()
 
 setup_db()
 
+class ViewCounter:
+    """
+    Buffer view count increments in memory and write them in batches.
+    
+    Views are counted per share and written in one transaction by a
+    background thread, at most max_staleness seconds after they happen, or
+    sooner once threshold views are pending. Pending counts are also written
+    when the process exits, so a graceful worker shutdown loses nothing.
+    """
+    def __init__(self, max_staleness, threshold):
+        self.max_staleness = max_staleness
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = {}
+        self._pending_total = 0
+        self._pid = None
+        atexit.register(self._flush_logged)
+    
+    def increment(self, share_id):
+        """Count one view of a share."""
+        with self._lock:
+            self._pending[share_id] = self._pending.get(share_id, 0) + 1
+            self._pending_total += 1
+            full = self._pending_total >= self.threshold
+            if self._pid != os.getpid():
+                # Threads do not survive a fork, so every worker starts its own flusher
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name="view-counter", daemon=True).start()
+        if full:
+            self._wake.set()
+    
+    @property
+    def pending(self):
+        """Views counted but not yet written."""
+        return self._pending_total
+    
+    def flush(self):
+        """Write all pending increments in one transaction."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._pending_total = 0
+            if not pending:
+                return
+            try:
+                with stage_seconds.time('view_count_flush'), get_db() as conn:
+                    conn.executemany("UPDATE shares SET view_count = view_count + ? WHERE id = ?",
+                                     [(count, share_id) for share_id, count in pending.items()])
+                views_flushed_total.inc(amount=sum(pending.values()))
+            except sqlite3.Error:
+                # Keep the counts for the next attempt
+                with self._lock:
+                    for share_id, count in pending.items():
+                        self._pending[share_id] = self._pending.get(share_id, 0) + count
+                    self._pending_total += sum(pending.values())
+                raise
+    
+    def _flush_logged(self):
+        try:
+            self.flush()
+        except sqlite3.Error:
+            app.logger.exception("Failed to write view counts")
+    
+    def _run(self):
+        while True:
+            self._wake.wait(self.max_staleness)
+            self._wake.clear()
+            self._flush_logged()
+
+view_counter = ViewCounter(VIEW_COUNT_MAX_STALENESS, VIEW_COUNT_FLUSH_THRESHOLD)
+
+class ShareCache:
+    """
+    Least-recently-used cache of shares, as (project_name, data, encoding).
+    
+    data is the share as stored, so compressed shares stay compressed in
+    memory. Bounded both by the number of shares and by their total size;
+    a share larger than the whole budget is not cached. Shares are never
+    modified, so entries are only evicted, or dropped once the share
+    expires. Each worker has its own caches, and a worker only discards
+    shares it deletes itself, so an entry that may outlive its share must
+    carry the share's expiry time.
+    
+    The rendered pages are kept in a second instance, in the same form.
+    """
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+    
+    def get(self, share_id):
+        """Return the cached share, or None."""
+        entry = self.lookup(share_id)
+        return None if entry is None else entry[0]
+    
+    def lookup(self, share_id):
+        """Return (share, expiry time or None) for a cached share, or None."""
+        with self._lock:
+            entry = self._entries.get(share_id)
+            if entry is not None and entry[2] is not None and entry[2] <= time.time():
+                # The share is gone, or about to be
+                del self._entries[share_id]
+                self._bytes -= entry[1]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(share_id)
+            self.hits += 1
+            return entry[0], entry[2]
+    
+    def put(self, share_id, share, size=None, expires=None):
+        """Cache a share, evicting the least recently used ones to make room.
+        
+        size is what the entry counts against max_bytes, by default the length of its data.
+        expires is the time.time() at which the entry stops being returned.
+        """
+        if size is None:
+            size = len(share[1])
+        if size > self.max_bytes or self.max_entries < 1:
+            return
+        with self._lock:
+            old = self._entries.pop(share_id, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[share_id] = (share, size, expires)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[1]
+                self.evictions += 1
+    
+    def discard(self, share_id):
+        """Drop a share from the cache, if it is there."""
+        with self._lock:
+            old = self._entries.pop(share_id, None)
+            if old is not None:
+                self._bytes -= old[1]
+    
+    def stats(self):
+        """Counters and current size of the cache."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+share_cache = ShareCache(SHARE_CACHE_MAX_ENTRIES, SHARE_CACHE_MAX_BYTES)
+# Keyed by the page ETag, which names both the share and the template version
+page_cache = ShareCache(PAGE_CACHE_MAX_ENTRIES, PAGE_CACHE_MAX_BYTES)
+
+# A line as written by structure.py: a prefix segment per ancestor, then the connector
+TREE_LINE = re.compile(r'((?:│   |    )*)(├── |└── )?[^\n]*\n?')
+
+class ShareOutline:
+    """
+    Line index of a share's tree text, for serving it a directory at a time.
+    
+    The lines are in the order the tree was walked, so the lines below a
+    directory are the run of deeper lines that follows it: ends[i] is the
+    index just past line i's subtree, and a line's children are found by
+    jumping from one subtree end to the next. Each line is served as
+    written, since its prefix already draws the branches above it.
+    Lines that are not tree lines count as top-level ones.
+    """
+    def __init__(self, text):
+        self.text = text
+        self.starts = array('L')
+        self.ends = array('L')
+        open_lines = []
+        depths = []
+        for match in TREE_LINE.finditer(text):
+            start, prefix_end = match.span(1)
+            if start == len(text):
+                break
+            line = len(self.starts)
+            self.starts.append(start)
+            self.ends.append(0)
+            # Only a line with a connector is nested below another
+            depth = (prefix_end - start) // 4 + 1 if match.group(2) else 0
+            
+            # Lines at this depth or above close the subtrees still open
+            while depths and depths[-1] >= depth:
+                self.ends[open_lines.pop()] = line
+                depths.pop()
+            open_lines.append(line)
+            depths.append(depth)
+        for line in open_lines:
+            self.ends[line] = len(self.starts)
+    
+    def __len__(self):
+        return len(self.starts)
+    
+    def line(self, index):
+        """The text of a line."""
+        end = self.starts[index + 1] - 1 if index + 1 < len(self.starts) else len(self.text)
+        return self.text[self.starts[index]:end].rstrip('\r\n')
+    
+    def size(self):
+        """Approximate memory held, for the cache budget."""
+        return len(self.text) * 2 + len(self.starts) * 2 * self.starts.itemsize
+    
+    def children(self, parent=-1, start=None, limit=TREE_PAGE_SIZE):
+        """
+        One page of the lines directly below a line.
+        
+        Args:
+            parent (int): Index of the directory line, or -1 for the top-level lines
+            start (int): Index of the first child to return, from a previous page's 'next'
+            limit (int): Most lines to return
+        
+        Returns:
+            dict: 'lines' as [index, text, number of lines below it], and 'next',
+                  the index to continue from, or None after the last child
+        """
+        end = len(self.starts) if parent < 0 else self.ends[parent]
+        index = parent + 1 if start is None else start
+        if index <= parent:
+            index = parent + 1
+        lines = []
+        while index < end and len(lines) < limit:
+            lines.append([index, self.line(index), self.ends[index] - index - 1])
+            index = self.ends[index]
+        return {'lines': lines, 'next': index if index < end else None}
+
+outline_cache = ShareCache(OUTLINE_CACHE_MAX_ENTRIES, OUTLINE_CACHE_MAX_BYTES)
+
+def stored_encoding(file_path):
+    """Content-Encoding of a stored share: 'gzip', or None for shares saved as plain text."""
+    return 'gzip' if file_path.endswith('.gz') else None
+
+def gzip_length(file_path):
+    """Uncompressed length of a gzip file we wrote, from its trailer."""
+    with open(file_path, 'rb') as f:
+        f.seek(-4, os.SEEK_END)
+        return struct.unpack('<I', f.read(4))[0]
+
+def iter_gunzip(file_path, chunk_size=64 * 1024):
+    """Yield the decompressed content of a gzip file (a path or a binary file object) in chunks."""
+    with gzip.open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def share_text(share):
+    """The content of a loaded share as text."""
+    _, data, encoding = share
+    if encoding == 'gzip':
+        data = gzip.decompress(data)
+    return data.decode('utf-8', errors='replace')
+
+def share_length(share):
+    """Length in bytes of a loaded share's content, without decompressing it."""
+    _, data, encoding = share
+    if encoding == 'gzip':
+        return struct.unpack('<I', data[-4:])[0]
+    return len(data)
+
+def load_outline(share_id, loaded=None):
+    """
+    The line index of a share, built on first use and cached.
+    
+    An index too large for the outline cache would be rebuilt for every page,
+    so such a share is not indexed; a small cache entry records that instead,
+    and the share is only viewed raw.
+    
+    Args:
+        share_id (str): The share
+        loaded (tuple): The share and its expiry, as from load_share, if already loaded
+    
+    Returns:
+        tuple: (ShareOutline, or None if the share is too large to index, expiry time or None),
+        or None if the share does not exist
+    """
+    cached = outline_cache.lookup(share_id)
+    if cached is not None:
+        return cached[0][1], cached[1]
+    if loaded is None:
+        loaded = load_share(share_id)
+        if loaded is None:
+            return None
+    share, expires = loaded
+    outline = None
+    # The index holds the text at up to two bytes a character, so some shares
+    # are too large without decompressing them to find out
+    if share_length(share) * 2 <= OUTLINE_CACHE_MAX_BYTES:
+        with stage_seconds.time('outline_build'):
+            outline = ShareOutline(share_text(share))
+        if outline.size() > OUTLINE_CACHE_MAX_BYTES:
+            outline = None
+    outline_cache.put(share_id, (share[0], outline, None), 1 if outline is None else outline.size(), expires)
+    return outline, expires
+
+def share_expiry(created_at, expires_at):
+    """
+    When a share expires, from its database row, as a time.time() value.
+    
+    Returns:
+        float: The expiry time, or None if the share is kept for good
+    """
+    expiry = None
+    if expires_at is not None:
+        expiry = datetime.fromisoformat(expires_at).timestamp()
+    if SHARE_MAX_AGE > 0 and created_at is not None:
+        aged = datetime.fromisoformat(created_at).timestamp() + SHARE_MAX_AGE
+        expiry = aged if expiry is None else min(expiry, aged)
+    return expiry
+
+def load_share(share_id):
+    """
+    Look up a share and its stored content, from the cache when possible.
+    
+    Returns:
+        tuple: ((project_name, data bytes, encoding), expiry time or None), or
+               None if the share does not exist or has expired
+    """
+    cached = share_cache.lookup(share_id)
+    if cached is not None:
+        return cached
+    
+    with stage_seconds.time('share_lookup'):
+        result = get_db().execute(
+            "SELECT project_name, file_path, created_at, expires_at FROM shares WHERE id = ?", (share_id,)
+        ).fetchone()
+    if not result:
+        return None
+    
+    project_name, file_path, created_at, expires_at = result
+    # An expired share is gone, even before a sweep deletes it
+    expires = share_expiry(created_at, expires_at)
+    if expires is not None and expires <= time.time():
+        return None
+    try:
+        with stage_seconds.time('share_read'), open(file_path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    
+    share = (project_name, data, stored_encoding(file_path))
+    share_cache.put(share_id, share, expires=expires)
+    return share, expires
+
+def raw_etag(share_id, encoding):
+    """
+    Strong ETag of a share's raw content in an encoding.
+    
+    A share never changes, so its ID identifies the content; each encoding
+    is a different representation and needs its own tag.
+    """
+    return share_id if encoding is None else f"{share_id}-{encoding}"
+
+def share_cache_control(expires):
+    """Cache-Control for a share's raw text and tree pages: for good, or until the share expires."""
+    if expires is None:
+        return RAW_CACHE_CONTROL
+    return f"public, max-age={max(0, int(expires - time.time()))}"
+
+def raw_headers(response, encoding, expires):
+    """Add the headers every /raw/<share_id> response carries."""
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = share_cache_control(expires)
+    return response
+
+def view_etag(share_id):
+    """Strong ETag of a share's page; a changed template is not answered with 304."""
+    return f"{share_id}-{VIEW_TEMPLATE_TAG}"
+
+def not_modified(etag, cache_control):
+    """A 304 response for a client whose copy matches etag."""
+    response = make_response('', 304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def share_path(name, suffix):
+    """Where a share file named name + suffix is stored, under its shard directories."""
+    shards = [name[2 * level:2 * level + 2] for level in range(SHARE_SHARD_LEVELS)]
+    return os.path.join(SHARES_DIR, *shards, name + suffix)
+
+def store_compressed(stream, fd, chunk_size=64 * 1024):
+    """
+    Gzip a stream into an open file, hashing the uncompressed content.
+    
+    mtime=0 keeps the output of identical content byte-identical.
+    
+    Returns:
+        tuple: (sha256 of the content, its length in bytes)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(fd, 'wb') as out:
+        with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=SHARE_GZIP_LEVEL, mtime=0) as f:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+    return digest, size
+
+def delete_shares(share_ids):
+    """
+    Delete shares in one transaction, and each stored file no other share refers to.
+    
+    Returns:
+        list: The IDs of the shares that existed
+    """
+    deleted = []
+    with get_db() as conn:
+        # Counted under the write lock, so a concurrent upload of the same content
+        # either sees the blob gone or keeps it alive
+        conn.execute("BEGIN IMMEDIATE")
+        for share_id in share_ids:
+            row = conn.execute("SELECT file_path, content_hash FROM shares WHERE id = ?", (share_id,)).fetchone()
+            if row is None:
+                continue
+            file_path, content_hash = row
+            conn.execute("DELETE FROM shares WHERE id = ?", (share_id,))
+            deleted.append(share_id)
+            orphaned = True
+            if content_hash is not None:
+                conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?", (content_hash,))
+                orphaned = conn.execute(
+                    "DELETE FROM blobs WHERE hash = ? AND refcount <= 0", (content_hash,)
+                ).rowcount > 0
+            if orphaned:
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+    for share_id in deleted:
+        share_cache.discard(share_id)
+        page_cache.discard(view_etag(share_id))
+        outline_cache.discard(share_id)
+    return deleted
+
+def sweep_expired(batch_size=SHARE_SWEEP_BATCH_SIZE, pause=SHARE_SWEEP_PAUSE):
+    """
+    Delete every expired share, a batch per transaction.
+    
+    Expired shares are found through the expires_at and created_at indexes.
+    The write lock is only held while a batch is deleted, and released for
+    `pause` seconds between batches, so uploads are never held up for long.
+    
+    Returns:
+        int: The number of shares deleted
+    """
+    conn = get_db()
+    now = datetime.now()
+    queries = [("SELECT id FROM shares WHERE expires_at <= ? LIMIT ?", now)]
+    if SHARE_MAX_AGE > 0:
+        queries.append(("SELECT id FROM shares WHERE created_at <= ? LIMIT ?",
+                        datetime.fromtimestamp(now.timestamp() - SHARE_MAX_AGE)))
+    swept = 0
+    for query, cutoff in queries:
+        while True:
+            share_ids = [row[0] for row in conn.execute(query, (cutoff, batch_size))]
+            if not share_ids:
+                break
+            with stage_seconds.time('sweep_batch'):
+                deleted = delete_shares(share_ids)
+            shares_expired_total.inc(amount=len(deleted))
+            swept += len(deleted)
+            if len(share_ids) < batch_size:
+                break
+            time.sleep(pause)
+    return swept
+
+class ShareSweeper:
+    """
+    Sweep for expired shares in a background thread of each worker.
+    
+    Sweeps start at random points of the interval, so several workers rarely
+    sweep at once; when they do, a share deleted by one is skipped by the other.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pid = None
+    
+    def start(self):
+        """Start this process's sweeper thread, if it is not running yet."""
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Threads do not survive a fork, so every worker starts its own
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name="share-sweeper", daemon=True).start()
+    
+    def _run(self):
+        while True:
+            time.sleep(self.interval * random.uniform(0.5, 1.5))
+            try:
+                swept = sweep_expired()
+                if swept:
+                    app.logger.info("Deleted %d expired shares", swept)
+            except sqlite3.Error:
+                app.logger.exception("Failed to delete expired shares")
+
+share_sweeper = ShareSweeper(SHARE_SWEEP_INTERVAL)
+
+@app.cli.command('sweep-expired')
+@click.option('--batch-size', default=SHARE_SWEEP_BATCH_SIZE, show_default=True, help="Shares deleted per transaction.")
+@click.option('--pause', default=SHARE_SWEEP_PAUSE, show_default=True, help="Seconds between transactions.")
+def sweep_expired_command(batch_size, pause):
+    """Delete expired shares and their files now, while the server runs."""
+    click.echo(f"Done, {sweep_expired(batch_size, pause)} expired shares deleted")
+
+def migrate_storage(batch_size=500, pause=0.1, log=print):
+    """
+    Move share files from the flat shares/ directory into the sharded layout.
+    
+    Safe to run while the server is serving. Each batch is moved under the
+    database write lock: the files are hard-linked at their new paths and
+    the rows updated in one transaction, so a reader always finds the file
+    its row names. The old names are only unlinked after a pause, once no
+    request can still hold a path it read before the batch committed.
+    
+    Args:
+        batch_size (int): Files moved per transaction
+        pause (float): Seconds between a batch's commit and removing its old names
+        log (callable): Receives a progress line per batch
+    
+    Returns:
+        int: The number of files moved
+    """
+    sharded = os.path.join(SHARES_DIR, *(['_' * 2] * SHARE_SHARD_LEVELS), '%')
+    # Deduplicated content first, named by hash, then the shares from before that, named by ID
+    queries = (
+        ("SELECT hash, file_path FROM blobs WHERE file_path NOT LIKE ? LIMIT ?",
+         ["UPDATE blobs SET file_path = ? WHERE hash = ?",
+          "UPDATE shares SET file_path = ? WHERE content_hash = ?"]),
+        ("SELECT id, file_path FROM shares WHERE content_hash IS NULL AND file_path NOT LIKE ? LIMIT ?",
+         ["UPDATE shares SET file_path = ? WHERE id = ?"]),
+    )
+    conn = get_db()
+    moved = 0
+    for select, updates in queries:
+        while True:
+            old_paths = []
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                rows = conn.execute(select, (sharded, batch_size)).fetchall()
+                for name, old_path in rows:
+                    suffix = '.txt.gz' if old_path.endswith('.gz') else '.txt'
+                    new_path = share_path(name, suffix)
+                    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                    try:
+                        os.link(old_path, new_path)
+                        old_paths.append(old_path)
+                    except FileExistsError:
+                        old_paths.append(old_path)
+                    except FileNotFoundError:
+                        # Nothing to move; the row still gets the new path so it is not retried
+                        pass
+                    for update in updates:
+                        conn.execute(update, (new_path, name))
+            if not rows:
+                break
+            
+            time.sleep(pause)
+            for old_path in old_paths:
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    pass
+            moved += len(old_paths)
+            log(f"Moved {moved} files")
+    return moved
+
+@app.cli.command('migrate-storage')
+@click.option('--batch-size', default=500, show_default=True, help="Files moved per transaction.")
+@click.option('--pause', default=0.1, show_default=True, help="Seconds before a batch's old files are removed.")
+def migrate_storage_command(batch_size, pause):
+    """Move share files into the sharded directory layout, while the server runs."""
+    moved = migrate_storage(batch_size, pause, log=click.echo)
+    click.echo(f"Done, {moved} files moved")
+
 # Generate a unique ID for sharing
 def generate_share_id():
     return str(uuid.uuid4())
@@ -58,36 +821,308 @@ def serve_structure_py():
     """Serve the structure.py script."""
     return send_from_directory(SCRIPTS_DIR, 'structure.py')
 
+def parse_ttl(value):
+    """
+    The ttl form field: the share's lifetime in seconds, if it has one.
+    
+    Returns:
+        datetime: When the share expires, or None if it does not
+    
+    Raises:
+        ValueError: If the ttl is not a whole number of seconds from 1 to SHARE_MAX_TTL
+    """
+    if value is None or value == '':
+        return None
+    ttl = int(value)
+    if ttl < 1 or ttl > SHARE_MAX_TTL:
+        raise ValueError(value)
+    return datetime.fromtimestamp(time.time() + ttl)
+
+def compress_upload(file):
+    """
+    Compress an uploaded file into a temporary file, hashing the content on the way.
+    
+    The upload is already spooled to a temporary file, so this copies in chunks.
+    
+    Returns:
+        tuple: (temporary file path, sha256 hex digest of the content, content length)
+    """
+    fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=SHARES_DIR)
+    try:
+        with stage_seconds.time('upload_compress'):
+            digest, size = store_compressed(file.stream, fd)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    upload_bytes.observe(size)
+    return temp_path, digest.hexdigest(), size
+
+def insert_share(conn, share_id, project_name, temp_path, content_hash, size, expires_at):
+    """
+    Record a share of compressed content, storing the file unless the content is stored already.
+    
+    Must run in a transaction that holds the write lock (BEGIN IMMEDIATE), so
+    no deletion or migration can move the blob in between. temp_path is moved
+    into place when it is kept, and left for the caller to remove otherwise.
+    """
+    now = datetime.now()
+    blob = conn.execute("SELECT file_path FROM blobs WHERE hash = ?", (content_hash,)).fetchone()
+    if blob is not None and os.path.exists(blob[0]):
+        file_path = blob[0]
+        conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE hash = ?", (content_hash,))
+        uploads_total.inc('duplicate')
+    else:
+        uploads_total.inc('new')
+        # New content (or a lost file): keep this copy
+        file_path = share_path(content_hash, '.txt.gz')
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        os.replace(temp_path, file_path)
+        if blob is None:
+            conn.execute(
+                "INSERT INTO blobs (hash, file_path, size, stored_size, refcount) VALUES (?, ?, ?, ?, 1)",
+                (content_hash, file_path, size, os.path.getsize(file_path))
+            )
+        else:
+            conn.execute(
+                "UPDATE blobs SET file_path = ?, stored_size = ?, refcount = refcount + 1 WHERE hash = ?",
+                (file_path, os.path.getsize(file_path), content_hash)
+            )
+            conn.execute("UPDATE shares SET file_path = ? WHERE content_hash = ?", (file_path, content_hash))
+    conn.execute(
+        "INSERT INTO shares (id, project_name, created_at, file_path, content_hash, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (share_id, project_name, now, file_path, content_hash, expires_at)
+    )
+
 @app.route('/api/share', methods=['POST'])
 def create_share():
-    """API endpoint to create a new share."""
+    """
+    API endpoint to create a new share.
+    
+    Form fields: content (the tree file), project, and ttl, the seconds
+    until the share is deleted (kept for good if not given).
+    """
     if 'content' not in request.files:
         return "No file uploaded", 400
     
     file = request.files['content']
     project_name = request.form.get('project', 'Unnamed Project')
+    try:
+        expires_at = parse_ttl(request.form.get('ttl'))
+    except ValueError:
+        return "Invalid ttl", 400
     
     # Generate a unique ID
     share_id = generate_share_id()
     
-    # Save the file
-    file_path = os.path.join(SHARES_DIR, f"{share_id}.txt")
-    file.save(file_path)
-    
-    # Store in database
-    conn = sqlite3.connect(SHARE_DB)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO shares (id, project_name, created_at, file_path) VALUES (?, ?, ?, ?)",
-        (share_id, project_name, datetime.now(), file_path)
-    )
-    conn.commit()
-    conn.close()
+    temp_path, content_hash, size = compress_upload(file)
+    try:
+        # Store in database
+        # The connection outlives the request, so a failed write must not leave a transaction open
+        with stage_seconds.time('upload_commit'), get_db() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            insert_share(conn, share_id, project_name, temp_path, content_hash, size, expires_at)
+    finally:
+        # Identical content was already stored, or the upload failed
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
     
     # Return the shareable URL
     share_url = f"https://structure.sh/{share_id}"
     return share_url
 
+@app.route('/api/shares', methods=['POST'])
+def create_shares():
+    """
+    Create many shares in one request, committed in one transaction.
+    
+    Form fields: content, once per share; project, either once for all of
+    them or once per share in the same order; and ttl, as for /api/share,
+    applying to all of them. Returns the share URLs, one per line, in the
+    order of the files.
+    """
+    files = request.files.getlist('content')
+    if not files:
+        return "No file uploaded", 400
+    if len(files) > SHARE_BULK_MAX_SHARES:
+        return f"Too many shares in one request (limit: {SHARE_BULK_MAX_SHARES})", 400
+    projects = request.form.getlist('project') or ['Unnamed Project']
+    if len(projects) == 1:
+        projects = projects * len(files)
+    elif len(projects) != len(files):
+        return "Expected one project name, or one per file", 400
+    try:
+        expires_at = parse_ttl(request.form.get('ttl'))
+    except ValueError:
+        return "Invalid ttl", 400
+    
+    share_ids = [generate_share_id() for _ in files]
+    uploads = []
+    try:
+        # Compress everything before taking the write lock, so it is held only for the commit
+        for file in files:
+            uploads.append(compress_upload(file))
+        with stage_seconds.time('upload_commit'), get_db() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for share_id, project_name, (temp_path, content_hash, size) in zip(share_ids, projects, uploads):
+                insert_share(conn, share_id, project_name, temp_path, content_hash, size, expires_at)
+    finally:
+        for temp_path, _, _ in uploads:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    lines = [f"https://structure.sh/{share_id}" for share_id in share_ids]
+    return '\n'.join(lines) + '\n', 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    """Plain-text 413 for the command-line clients."""
+    # Werkzeug raises the same error for a body over MAX_CONTENT_LENGTH and
+    # for a form over MAX_FORM_PARTS; only the first has a length to blame
+    length = request.content_length
+    if length is not None and length <= SHARE_MAX_UPLOAD_BYTES:
+        return f"Too many files or fields in one upload (limit: {SHARE_MAX_FORM_PARTS} parts)", 413
+    return f"Structure too large to share (limit: {SHARE_MAX_UPLOAD_BYTES} bytes)", 413
+
+@app.route('/api/cache')
+def cache_stats():
+    """Hit, miss and eviction counters of this worker's share and page caches."""
+    return jsonify(dict(share_cache.stats(), pages=page_cache.stats(), outlines=outline_cache.stats()))
+
+@app.route('/api/tree/<share_id>')
+def tree_page(share_id):
+    """
+    One page of the lines directly below a line of a share, for the lazy viewer.
+    
+    Query parameters: parent (line index, -1 for the top level), start (the
+    'next' of the previous page) and limit.
+    """
+    try:
+        parent = int(request.args.get('parent', -1))
+        start = request.args.get('start')
+        start = None if start is None else int(start)
+        limit = min(max(int(request.args.get('limit', TREE_PAGE_SIZE)), 1), TREE_MAX_PAGE_SIZE)
+    except ValueError:
+        return "Invalid parameters", 400
+    
+    loaded = load_outline(share_id)
+    if loaded is None:
+        abort(404)
+    outline, expires = loaded
+    if outline is None:
+        return "Share too large to browse by directory; fetch it from /raw instead", 400
+    if parent >= len(outline) or (start is not None and start >= len(outline)):
+        return "Invalid parameters", 400
+    
+    response = jsonify(outline.children(max(parent, -1), start, limit))
+    response.headers['Cache-Control'] = share_cache_control(expires)
+    return response
+
+@app.route('/api/storage')
+def storage_stats():
+    """How much disk deduplication saves across the stored shares."""
+    return jsonify(storage_totals())
+
+class StorageTotals:
+    """
+    The storage totals, summed at most once per ttl seconds in each worker, so
+    they can lag changes by that long.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._summed = None
+    
+    def get(self):
+        """The totals, summed again if the last ones are over ttl seconds old."""
+        with self._lock:
+            if self._summed is None or time.monotonic() - self._summed[0] >= self.ttl:
+                self._summed = (time.monotonic(), sum_storage_totals())
+            return dict(self._summed[1])
+
+def storage_totals():
+    """Share, blob and byte totals of the deduplicated content, as of at most STORAGE_TOTALS_TTL seconds ago."""
+    return cached_storage_totals.get()
+
+def sum_storage_totals():
+    """Share, blob and byte totals of the deduplicated content, read from the database."""
+    blobs, shares, size, unique_size, stored, deduplicated = get_db().execute(
+        "SELECT COUNT(*), COALESCE(SUM(refcount), 0), COALESCE(SUM(size * refcount), 0), "
+        "COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0), COALESCE(SUM(stored_size * refcount), 0) "
+        "FROM blobs"
+    ).fetchone()
+    return {
+        'shares': shares,
+        'blobs': blobs,
+        'content_bytes': size,
+        'unique_content_bytes': unique_size,
+        'stored_bytes': stored,
+        'dedup_ratio': round(size / unique_size, 3) if unique_size else 1.0,
+        'bytes_saved': deduplicated - stored,
+    }
+
+cached_storage_totals = StorageTotals(STORAGE_TOTALS_TTL)
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    share_sweeper.start()
+
+@app.after_request
+def record_request(response):
+    """Count the request and time it, by the route it matched."""
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request_seconds.observe(time.perf_counter() - start, route, request.method)
+        requests_total.inc(route, request.method, response.status_code)
+    return response
+
+def cache_gauges(field):
+    """Collect one ShareCache counter from every cache."""
+    def collect():
+        return [((name,), cache.stats()[field])
+                for name, cache in (('shares', share_cache), ('pages', page_cache), ('outlines', outline_cache))]
+    return collect
+
+for field in ('entries', 'bytes'):
+    registry.register(metrics.Gauge(f"structure_cache_{field}", f"Cache {field}, by cache.", ('cache',),
+                                    cache_gauges(field)))
+for field in ('hits', 'misses', 'evictions'):
+    registry.register(metrics.Gauge(f"structure_cache_{field}_total", f"Cache {field}, by cache.", ('cache',),
+                                    cache_gauges(field), kind='counter'))
+registry.register(metrics.Gauge("structure_views_pending", "Views counted but not yet written.", (),
+                                lambda: [((), view_counter.pending)]))
+registry.register(metrics.Gauge("structure_storage", "Stored shares, blobs and bytes.", ('stat',),
+                                lambda: sorted(((name,), value) for name, value in storage_totals().items())))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """This worker's metrics in the Prometheus text format."""
+    return registry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+profiler = metrics.SamplingProfiler()
+
+@app.route('/debug/profile')
+def profile():
+    """
+    Sample this worker's threads and return the stacks, collapsed for flame graph tools.
+    
+    Query parameters: seconds (default 10) and interval (default 0.005).
+    Only available with PROFILER_ENABLED=1.
+    """
+    if not PROFILER_ENABLED:
+        abort(404)
+    try:
+        seconds = min(float(request.args.get('seconds', 10)), PROFILER_MAX_SECONDS)
+        interval = max(float(request.args.get('interval', 0.005)), 0.001)
+    except ValueError:
+        return "Invalid parameters", 400
+    stacks = profiler.sample(seconds, interval)
+    if stacks is None:
+        return "A profile is already being taken", 409
+    lines = [f"{stack} {count}" for stack, count in stacks.most_common()]
+    return '\n'.join(lines) + '\n', 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
 @app.route('/<share_id>')
 def view_share(share_id):
     """View a shared directory structure."""
@@ -99,35 +1134,58 @@ def view_share(share_id):
     if not all(c.isalnum() or c == '-' for c in share_id):
         return render_template('index.html')
     
-    # Get share info from database
-    conn = sqlite3.connect(SHARE_DB)
-    cursor = conn.cursor()
-    cursor.execute("SELECT project_name, file_path FROM shares WHERE id = ?", (share_id,))
-    result = cursor.fetchone()
+    # A page rendered before is served as it is; otherwise the share must exist
+    etag = view_etag(share_id)
+    page = page_cache.get(etag)
+    if page is None:
+        loaded = load_share(share_id)
+        if loaded is None:
+            return render_template('index.html')
+        share, expires = loaded
     
-    if not result:
-        conn.close()
-        return render_template('index.html')
+    # Count the view; it is written to the database in a later batch
+    view_counter.increment(share_id)
     
-    project_name, file_path = result
-    
-    # Increment view count
-    cursor.execute("UPDATE shares SET view_count = view_count + 1 WHERE id = ?", (share_id,))
-    conn.commit()
-    conn.close()
+    # A client that already has this page is not sent it again
+    if request.if_none_match.contains(etag):
+        return not_modified(etag, VIEW_CACHE_CONTROL)
     
-    # Read the file content
-    try:
-        with open(file_path, 'r') as f:
-            content = f.read()
-    except FileNotFoundError:
-        return render_template('index.html')
+    # Render the template with the content, once per share and template version.
+    # A large tree is sent as its first two levels and the rest fetched as expanded.
+    if page is None:
+        with stage_seconds.time('page_render'):
+            outline = None
+            if share_length(share) > VIEW_LAZY_THRESHOLD:
+                outline, _ = load_outline(share_id, loaded)
+            if outline is not None:
+                tree = {'top': outline.children(), 'lines': len(outline)}
+                top = tree['top']['lines']
+                if len(top) == 1 and top[0][2]:
+                    tree['root'] = outline.children(top[0][0])
+                html = render_template('view.html', 
+                                       project_name=share[0], 
+                                       content=None, 
+                                       tree=tree, 
+                                       share_id=share_id)
+            elif share_length(share) > VIEW_LAZY_THRESHOLD:
+                # Too large to index: the page only links to the raw text
+                html = render_template('view.html', 
+                                       project_name=share[0], 
+                                       content=None, 
+                                       tree=None, 
+                                       share_id=share_id)
+            else:
+                html = render_template('view.html', 
+                                       project_name=share[0], 
+                                       content=share_text(share), 
+                                       share_id=share_id)
+        page = (share[0], html.encode('utf-8'), None)
+        page_cache.put(etag, page, expires=expires)
     
-    # Render the template with the content
-    return render_template('view.html', 
-                          project_name=project_name, 
-                          content=content, 
-                          share_id=share_id)
+    response = make_response(page[1])
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = VIEW_CACHE_CONTROL
+    return response
 
 @app.route('/raw/<share_id>')
 def raw_share(share_id):
@@ -157,27 +1215,59 @@ def raw_share(share_id):
     if not all(c.isalnum() or c == '-' for c in share_id):
         abort(404)
     
-    # Get file path from database
-    conn = sqlite3.connect(SHARE_DB)
-    cursor = conn.cursor()
-    cursor.execute("SELECT file_path FROM shares WHERE id = ?", (share_id,))
-    result = cursor.fetchone()
-    conn.close()
+    # Compressed shares go out as stored to clients that accept gzip
+    accepts_gzip = request.accept_encodings['gzip'] > 0
     
+    # Serve a cached share from memory, without the DB or disk
+    cached = share_cache.lookup(share_id)
+    if cached is not None:
+        share, expires = cached
+        _, data, encoding = share
+        if encoding == 'gzip' and not accepts_gzip:
+            # Inflate in chunks as the response is sent, as the disk path does
+            response = app.response_class(iter_gunzip(io.BytesIO(data)))
+            length = response.content_length = share_length(share)
+            encoding = None
+        else:
+            response = make_response(data)
+            length = len(data)
+        response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+        response.set_etag(raw_etag(share_id, encoding))
+        raw_headers(response, encoding, expires)
+        # Handles If-None-Match and Range
+        return response.make_conditional(request, accept_ranges=True, complete_length=length)
+    
+    # Get file path from database
+    with stage_seconds.time('share_lookup'):
+        result = get_db().execute(
+            "SELECT file_path, created_at, expires_at FROM shares WHERE id = ?", (share_id,)
+        ).fetchone()
     if not result:
         abort(404)
+    expires = share_expiry(result[1], result[2])
+    if expires is not None and expires <= time.time():
+        abort(404)
     
-    file_path = result[0]
-    
-    # Read the file content
+    file_path = os.path.abspath(result[0])
+    encoding = stored_encoding(file_path)
     try:
-        with open(file_path, 'r') as f:
-            content = f.read()
+        if encoding is None or accepts_gzip:
+            # Stream the file from disk (with sendfile where the server supports it),
+            # so memory per request does not grow with the share
+            # Named after the share, not the content hash the file is stored under
+            response = send_file(file_path, mimetype='text/plain', etag=raw_etag(share_id, encoding),
+                                 conditional=True, download_name=f"{share_id}.txt")
+        else:
+            # Decompress on the fly for clients that cannot take gzip
+            length = gzip_length(file_path)
+            response = app.response_class(iter_gunzip(file_path), mimetype='text/plain')
+            response.content_length = length
+            response.set_etag(raw_etag(share_id, None))
+            # A Range is cut from the decompressed stream, which stops once it is sent
+            response = response.make_conditional(request, accept_ranges=True, complete_length=length)
     except FileNotFoundError:
         abort(404)
-    
-    # Return as plain text
-    return content, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    return raw_headers(response, encoding if accepts_gzip else None, expires)
 
 @app.route('/demo')
 def demo():
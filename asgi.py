@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+asyncio serving mode for the share service.
+
+Serves the same Flask app (every route in app.py) from an asyncio event
+loop, for deployments where slow clients would otherwise hold a sync
+worker for the whole transfer:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+
+A request body is received on the event loop into a spooled temporary
+file before the app sees it, and the response is sent back on the event
+loop as the app produces it. The app itself, with its file and database
+I/O, runs on a bounded thread pool, so a thread is only busy while there
+is work to do: a client trickling an upload or reading a large tree slowly
+costs an idle coroutine, not a worker.
+"""
+import os
+import sys
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app, SHARE_MAX_UPLOAD_BYTES
+
+# Threads running the app per process; requests beyond this wait on the event loop
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", "16"))
+
+# Request bodies up to this size stay in memory, larger ones go to a temporary file
+BODY_SPOOL_BYTES = 1024 * 1024
+
+# Response bytes gathered per trip to the thread pool
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='asgi')
+
+async def run(func, *args):
+    """Run a blocking call on the thread pool."""
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+def build_environ(scope, body, content_length):
+    """
+    The WSGI environ for an ASGI HTTP request.
+    
+    Args:
+        scope (dict): The ASGI connection scope
+        body: File object holding the request body, at its start
+        content_length (int): Length of the body, or the declared length when it was not read
+    
+    Returns:
+        dict: The environ, with the body already complete (wsgi.input_terminated)
+    """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        # WSGI strings carry the raw bytes as latin-1
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(content_length),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').lower()
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name in ('content-length', 'transfer-encoding'):
+            # The body has been received whole; its length is set above
+            continue
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def declared_length(scope):
+    """The request's Content-Length header as an int, or None."""
+    for name, value in scope['headers']:
+        if name.lower() == b'content-length':
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+async def receive_body(receive, body):
+    """
+    Read the request body into a file, stopping once it passes the upload limit.
+    
+    Returns:
+        int: Bytes received; over SHARE_MAX_UPLOAD_BYTES if the body was cut short
+    """
+    received = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if chunk:
+            received += len(chunk)
+            if received > SHARE_MAX_UPLOAD_BYTES:
+                # The app answers 413 from the length alone
+                break
+            await run(body.write, chunk)
+    return received
+
+def read_response(iterator, size=RESPONSE_CHUNK_SIZE):
+    """
+    Take about `size` bytes from a WSGI response iterator.
+    
+    Returns:
+        tuple: (bytes, whether the iterator is exhausted)
+    """
+    parts = []
+    total = 0
+    while total < size:
+        part = next(iterator, None)
+        if part is None:
+            return b''.join(parts), True
+        parts.append(part)
+        total += len(part)
+    return b''.join(parts), False
+
+async def handle_http(scope, receive, send):
+    """Serve one HTTP request through the Flask app."""
+    body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_BYTES)
+    try:
+        # A body declared over the limit is refused without reading any of it
+        length = declared_length(scope)
+        if length is None or length <= SHARE_MAX_UPLOAD_BYTES:
+            length = await receive_body(receive, body)
+            await run(body.seek, 0)
+        environ = build_environ(scope, body, length)
+        
+        started = {}
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                  for name, value in headers]
+            return lambda data: None
+        
+        result = await run(flask_app, environ, start_response)
+        try:
+            iterator = iter(result)
+            # The app may only call start_response once its output starts
+            chunk, done = await run(read_response, iterator)
+            await send({'type': 'http.response.start',
+                        'status': started['status'],
+                        'headers': started['headers']})
+            while not done:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk, done = await run(read_response, iterator)
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': False})
+        finally:
+            if hasattr(result, 'close'):
+                await run(result.close)
+    finally:
+        await run(body.close)
+
+async def app(scope, receive, send):
+    """ASGI entry point."""
+    if scope['type'] == 'http':
+        await handle_http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Load-test the share server's read endpoints.
+
+Starts app.py under gunicorn in a temporary directory, uploads a handful of
+shares through /api/share, then fetches /raw/<id> and /<id> from several
+client threads for a fixed time and reports requests per second. With
+--baseline, the app.py of that git revision is measured the same way first,
+so the two can be compared.
+
+Usage:
+    python3 benchmarks/bench_app.py                          # current app.py
+    python3 benchmarks/bench_app.py --baseline HEAD~1        # before and after
+    python3 benchmarks/bench_app.py --workers 4 --threads 8 --clients 32 --seconds 10
+"""
+import os
+import sys
+import time
+import uuid
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+from urllib import request
+from urllib.error import HTTPError
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SHARES = 20
+SAMPLE = "\n".join(["project/"] + [f"├── file_{i:04d}.py" for i in range(500)] + ["└── README.md"])
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def prepare(workdir, source):
+    """Lay out an app directory running `source` as app.py."""
+    with open(os.path.join(workdir, 'app.py'), 'w', encoding='utf-8') as f:
+        f.write(source)
+    for name in ('templates', 'static', 'scripts', 'metrics.py', 'asgi.py'):
+        os.symlink(os.path.abspath(os.path.join(REPO_DIR, name)), os.path.join(workdir, name))
+
+def start_server(workdir, port, workers, threads, env=None):
+    """Run gunicorn on the app and wait until it accepts connections."""
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers), '--threads', str(threads), '--log-level', 'warning', 'app:app'],
+        cwd=workdir, env=None if env is None else dict(os.environ, **env))
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("server did not start")
+
+def upload(base_url, content):
+    """Create a share and return its id."""
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="project"\r\n\r\nbench\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="content"; filename="structure.txt"\r\n'
+            f'Content-Type: text/plain\r\n\r\n{content}\r\n--{boundary}--\r\n').encode('utf-8')
+    req = request.Request(f"{base_url}/api/share", data=body,
+                          headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    with request.urlopen(req) as response:
+        return response.read().decode('utf-8').rstrip('/').rsplit('/', 1)[-1]
+
+def hammer(urls, clients, seconds):
+    """Fetch the urls round-robin from `clients` threads; return (requests/sec, errors)."""
+    counts = [0] * clients
+    errors = [0] * clients
+    deadline = time.perf_counter() + seconds
+
+    def client(n):
+        i = n
+        while time.perf_counter() < deadline:
+            try:
+                with request.urlopen(urls[i % len(urls)]) as response:
+                    response.read()
+                counts[n] += 1
+            except (HTTPError, OSError):
+                errors[n] += 1
+            i += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - start), sum(errors)
+
+def measure(label, source, options):
+    workdir = tempfile.mkdtemp(prefix='structure-app-')
+    port = free_port()
+    process = None
+    try:
+        prepare(workdir, source)
+        process = start_server(workdir, port, options['workers'], options['threads'])
+        base_url = f"http://127.0.0.1:{port}"
+        ids = [upload(base_url, SAMPLE) for _ in range(SHARES)]
+        print(label)
+        for name, path in (('/raw/<id>', '/raw/'), ('/<id>', '/')):
+            rate, errors = hammer([f"{base_url}{path}{share_id}" for share_id in ids],
+                                  options['clients'], options['seconds'])
+            print(f"  {name:<10} {rate:10,.0f} req/s  {errors} errors")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(workdir)
+
+def main():
+    options = {'workers': 4, 'threads': 4, 'clients': 16, 'seconds': 5.0}
+    baseline = None
+    args = sys.argv[1:]
+    i = 0
+    while i < len(args):
+        if args[i] == '--baseline' and i + 1 < len(args):
+            baseline = args[i + 1]
+            i += 2
+        elif args[i] in ('--workers', '--threads', '--clients') and i + 1 < len(args):
+            options[args[i][2:]] = int(args[i + 1])
+            i += 2
+        elif args[i] == '--seconds' and i + 1 < len(args):
+            options['seconds'] = float(args[i + 1])
+            i += 2
+        else:
+            i += 1
+
+    print(f"{options['workers']} workers x {options['threads']} threads, "
+          f"{options['clients']} clients, {options['seconds']:g}s per endpoint")
+    if baseline is not None:
+        source = subprocess.run(['git', 'show', f'{baseline}:app.py'], cwd=REPO_DIR,
+                                check=True, capture_output=True, text=True).stdout
+        measure(f"app.py at {baseline}", source, options)
+    with open(os.path.join(REPO_DIR, 'app.py'), encoding='utf-8') as f:
+        measure("app.py (working tree)", f.read(), options)
+
+if __name__ == "__main__":
+    main()
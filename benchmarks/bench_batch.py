@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Compare mapping many packages one process at a time with one batch run.
+
+A synthetic monorepo of packages is built, and structure.py maps every
+package three ways: one process per package (what a build tool looping
+over packages does), one process given all packages in a --manifest, and
+one walk of the directory holding them all, for reference. A batch that
+also includes the monorepo root shows directories shared between
+overlapping roots being listed only once. The scan cache is off throughout.
+
+Usage:
+    python3 benchmarks/bench_batch.py                 # 300 packages of 200 entries
+    python3 benchmarks/bench_batch.py 1000 50
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+from bench_walker import SCRIPTS_DIR, build_tree
+
+STRUCTURE = os.path.join(SCRIPTS_DIR, 'structure.py')
+
+def run(args, workdir):
+    """Seconds taken by one structure.py process."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, STRUCTURE] + args + ['--no-cache'], cwd=workdir,
+                   check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def main():
+    args = sys.argv[1:]
+    packages = int(args[0]) if len(args) > 0 else 300
+    entries = int(args[1]) if len(args) > 1 else 200
+
+    workdir = tempfile.mkdtemp(prefix='structure-batch-')
+    try:
+        names = [f"packages/pkg_{n:04d}" for n in range(packages)]
+        for name in names:
+            os.makedirs(os.path.join(workdir, name))
+            build_tree(os.path.join(workdir, name), entries)
+        with open(os.path.join(workdir, 'manifest.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(names) + '\n')
+        with open(os.path.join(workdir, 'manifest-root.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(['.'] + names) + '\n')
+
+        print(f"{packages} packages of {entries:,} entries")
+        separate = sum(run([name, 'out.txt', ''], workdir) for name in names)
+        batch = run(['', 'out.txt', '', '--manifest', 'manifest.txt'], workdir)
+        output_dir = run(['', 'structure.txt', '', '--manifest', 'manifest.txt', '--output-dir', 'out'], workdir)
+        union = run(['packages', 'out.txt', ''], workdir)
+        overlapping = run(['', 'out.txt', '', '--manifest', 'manifest-root.txt'], workdir)
+        print(f"{'one process per package':<36} {separate:8.2f}s")
+        print(f"{'--manifest, one output':<36} {batch:8.2f}s  {separate / batch:6.1f}x")
+        print(f"{'--manifest --output-dir':<36} {output_dir:8.2f}s  {separate / output_dir:6.1f}x")
+        print(f"{'one walk of packages/':<36} {union:8.2f}s")
+        print(f"{'--manifest with the root as well':<36} {overlapping:8.2f}s  (each package is listed once, written twice)")
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
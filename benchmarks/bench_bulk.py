@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Measure bulk uploads, and what sweeping expired shares costs the requests around it.
+
+Starts app.py under gunicorn in a temporary directory. First, distinct
+shares are uploaded one per /api/share request, as a CI job does, and
+then the same number through /api/shares in batches. Then many shares are
+uploaded with a short ttl and left to expire. Reads of shares that are
+kept, plus uploads, run from client threads for a while, and then again
+while `flask sweep-expired` deletes the expired shares. The report gives
+the p50/p99 latency of both phases, and how long the sweep took.
+
+Usage:
+    python3 benchmarks/bench_bulk.py
+    python3 benchmarks/bench_bulk.py --shares 1000 --batch 200 --expired 20000
+"""
+import os
+import sys
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+import subprocess
+from urllib import request
+from urllib.error import HTTPError
+
+from bench_app import REPO_DIR, SAMPLE, free_port, prepare, start_server, upload
+
+def upload_many(base_url, contents, ttl=None):
+    """Create shares through /api/shares and return their ids."""
+    boundary = uuid.uuid4().hex
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="project"\r\n\r\nbench\r\n']
+    if ttl is not None:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="ttl"\r\n\r\n{ttl}\r\n')
+    for content in contents:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="content"; filename="structure.txt"\r\n'
+                     f'Content-Type: text/plain\r\n\r\n{content}\r\n')
+    parts.append(f'--{boundary}--\r\n')
+    req = request.Request(f"{base_url}/api/shares", data=''.join(parts).encode('utf-8'),
+                          headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    with request.urlopen(req) as response:
+        return [line.rsplit('/', 1)[-1] for line in response.read().decode('utf-8').split()]
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+def load(base_url, ids, stop, latencies, errors):
+    """Fetch kept shares, with an upload every tenth request, until stopped."""
+    i = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            if i % 10 == 9:
+                upload(base_url, f"{SAMPLE}\n{uuid.uuid4()}")
+            else:
+                with request.urlopen(f"{base_url}/raw/{ids[i % len(ids)]}") as response:
+                    response.read()
+            latencies.append(time.perf_counter() - start)
+        except (HTTPError, OSError):
+            errors.append(i)
+        i += 1
+
+def under_load(base_url, ids, clients, action):
+    """Run `action` while clients hammer the server; return (latencies, errors, action's result)."""
+    stop = threading.Event()
+    latencies = []
+    errors = []
+    threads = [threading.Thread(target=load, args=(base_url, ids, stop, latencies, errors)) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    try:
+        result = action()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    latencies.sort()
+    return latencies, errors, result
+
+def report(label, latencies, errors):
+    print(f"  {label:<24} {len(latencies):7,} requests  p50 {percentile(latencies, 0.5) * 1e3:7.2f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1e3:7.2f} ms  {len(errors)} errors")
+
+def main():
+    options = {'shares': 500, 'batch': 100, 'expired': 10_000, 'clients': 4}
+    args = sys.argv[1:]
+    i = 0
+    while i < len(args):
+        if args[i] in ('--shares', '--batch', '--expired', '--clients') and i + 1 < len(args):
+            options[args[i][2:]] = int(args[i + 1])
+            i += 2
+        else:
+            i += 1
+
+    workdir = tempfile.mkdtemp(prefix='structure-app-')
+    port = free_port()
+    process = None
+    try:
+        with open(os.path.join(REPO_DIR, 'app.py'), encoding='utf-8') as f:
+            prepare(workdir, f.read())
+        # Sweeps only run when this benchmark starts one
+        process = start_server(workdir, port, 2, 4, env={'SHARE_SWEEP_INTERVAL': '0'})
+        base_url = f"http://127.0.0.1:{port}"
+        count, batch = options['shares'], options['batch']
+
+        start = time.perf_counter()
+        for n in range(count):
+            upload(base_url, f"{SAMPLE}\nsingle {n}")
+        single = time.perf_counter() - start
+        start = time.perf_counter()
+        for n in range(0, count, batch):
+            upload_many(base_url, [f"{SAMPLE}\nbulk {m}" for m in range(n, min(n + batch, count))])
+        bulk = time.perf_counter() - start
+        print(f"{count:,} uploads")
+        print(f"  {'one per request':<24} {single:7.2f}s  {count / single:8,.0f} shares/s")
+        print(f"  {f'{batch} per request':<24} {bulk:7.2f}s  {count / bulk:8,.0f} shares/s  {single / bulk:.1f}x")
+
+        kept = upload_many(base_url, [f"{SAMPLE}\nkept {n}" for n in range(20)])
+        expired = options['expired']
+        for n in range(0, expired, 500):
+            upload_many(base_url, [f"{SAMPLE}\nexpired {m}" for m in range(n, min(n + 500, expired))], ttl=1)
+        time.sleep(1.5)
+
+        print(f"Sweeping {expired:,} expired shares, {options['clients']} clients reading and uploading")
+        latencies, errors, _ = under_load(base_url, kept, options['clients'], lambda: time.sleep(3))
+        report("no sweep", latencies, errors)
+
+        def sweep():
+            start = time.perf_counter()
+            result = subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'sweep-expired'],
+                                    cwd=workdir, check=True, capture_output=True, text=True)
+            return time.perf_counter() - start, result.stdout.strip()
+        latencies, errors, (seconds, output) = under_load(base_url, kept, options['clients'], sweep)
+        report("during sweep", latencies, errors)
+        print(f"  {output}, in {seconds:.2f}s")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
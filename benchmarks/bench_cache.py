@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Compare a cold scan with cached re-scans of an unchanged and a touched tree.
+
+The cache lives in a temporary directory so the user's own cache is left
+alone. Every cached run is checked against an uncached walk.
+
+Usage:
+    python3 benchmarks/bench_cache.py                   # 10k, 100k and 1M entries
+    python3 benchmarks/bench_cache.py 10000 50000       # custom sizes
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from bench_walker import DEFAULT_SIZES, build_tree, load_script
+
+def timed_walk(structure, root, cache):
+    start = time.perf_counter()
+    lines = [structure.render_line(node) for node in structure.iter_tree(root, cache=cache)]
+    if cache is not None:
+        cache.save()
+    return time.perf_counter() - start, lines
+
+def backdate(root, seconds):
+    """Move every directory mtime into the past, outside the cache's racy window."""
+    past = time.time() - seconds
+    for path, _, _ in os.walk(root):
+        os.utime(path, (past, past))
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    structure = load_script('structure.py', 'structure')
+
+    for size in sizes:
+        root = tempfile.mkdtemp(prefix='structure-bench-')
+        cache_path = os.path.join(tempfile.mkdtemp(prefix='structure-cache-'), 'cache.json')
+        try:
+            created = build_tree(root, size)
+            backdate(root, 60)
+            print(f"{created:,} entries")
+
+            cold, lines = timed_walk(structure, root, structure.ScanCache(cache_path, load=False))
+            print(f"  cold scan            {cold:8.3f}s")
+
+            warm, cached = timed_walk(structure, root, structure.ScanCache(cache_path))
+            status = "ok" if cached == lines else "OUTPUT DIFFERS"
+            print(f"  unchanged re-scan    {warm:8.3f}s  {warm / cold:6.1%} of cold  {status}")
+
+            # Add a file to one directory; only that directory is listed again
+            changed = os.path.join(root, 'dir_00')
+            open(os.path.join(changed, 'added.txt'), 'w').close()
+            past = time.time() - 10
+            os.utime(changed, (past, past))
+            _, expected = timed_walk(structure, root, None)
+            touched, cached = timed_walk(structure, root, structure.ScanCache(cache_path))
+            status = "ok" if cached == expected else "OUTPUT DIFFERS"
+            print(f"  one dir changed      {touched:8.3f}s  {touched / cold:6.1%} of cold  {status}")
+        finally:
+            shutil.rmtree(root)
+            shutil.rmtree(os.path.dirname(cache_path))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Replay an upload log against app.py and report what deduplication saves.
+
+Each upload in the log is posted to /api/share (using Flask's test client,
+in a scratch directory), and every share is then read back from /raw/<id>
+to check its content. Reports the dedup ratio and the bytes saved from
+/api/storage, alongside the size of the shares directory on disk.
+
+The log is either a directory of stored shares (such as the shares/ of a
+server from before deduplication, one .txt or .txt.gz per upload, in any
+subdirectory), replayed
+oldest first, or a text file listing one such file per line. Without one, a
+CI-like log is generated: a few projects, each uploaded on every run, with
+the tree changing only every few runs.
+
+Usage:
+    python3 benchmarks/bench_dedup.py                      # generated log
+    python3 benchmarks/bench_dedup.py --runs 500 --projects 10
+    python3 benchmarks/bench_dedup.py /srv/structure/shares
+    python3 benchmarks/bench_dedup.py uploads.txt
+"""
+import io
+import os
+import sys
+import gzip
+import shutil
+import tempfile
+
+from bench_storage import load_app
+
+def generated_log(runs, projects, change_every=5, files=2000):
+    """Yield (project, content) for `runs` CI runs that each upload every project's tree."""
+    for run in range(runs):
+        for project in range(projects):
+            # The tree gains a file every few runs and is otherwise unchanged
+            version = run // change_every
+            lines = [f"project-{project}/"] + [f"├── src/module_{i:05d}.py" for i in range(files + version)]
+            lines.append("└── README.md")
+            yield f"project-{project}", "\n".join(lines).encode('utf-8')
+
+def replayed_log(path):
+    """Yield (project, content) for the stored shares in a directory or listed in a file."""
+    if os.path.isdir(path):
+        names = [os.path.join(root, name) for root, _, files in os.walk(path)
+                 for name in files if name.endswith(('.txt', '.txt.gz'))]
+        names.sort(key=os.path.getmtime)
+    else:
+        with open(path, encoding='utf-8') as f:
+            names = [line.strip() for line in f if line.strip()]
+    for name in names:
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(name, 'rb') as f:
+            yield os.path.basename(name), f.read()
+
+def disk_usage(directory):
+    """Bytes allocated to the files in a directory."""
+    total = 0
+    for root, _, files in os.walk(directory):
+        total += sum(os.stat(os.path.join(root, name)).st_blocks * 512 for name in files)
+    return total
+
+def main():
+    runs = 100
+    projects = 5
+    log = None
+    args = sys.argv[1:]
+    i = 0
+    while i < len(args):
+        if args[i] == '--runs' and i + 1 < len(args):
+            runs = int(args[i + 1])
+            i += 2
+        elif args[i] == '--projects' and i + 1 < len(args):
+            projects = int(args[i + 1])
+            i += 2
+        else:
+            log = args[i]
+            i += 1
+
+    uploads = replayed_log(log) if log is not None else generated_log(runs, projects)
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='structure-app-')
+    try:
+        client = load_app(workdir).app.test_client()
+        shares = []
+        for project, content in uploads:
+            response = client.post('/api/share', data={'project': project, 'content': (io.BytesIO(content), 'structure.txt')})
+            shares.append((response.get_data(as_text=True).rsplit('/', 1)[-1], len(content)))
+
+        differs = sum(1 for share_id, size in shares if len(client.get(f'/raw/{share_id}').get_data()) != size)
+        stats = client.get('/api/storage').get_json()
+
+        print(f"{stats['shares']:,} uploads, {stats['blobs']:,} distinct")
+        print(f"  content              {stats['content_bytes']:14,} bytes")
+        print(f"  distinct content     {stats['unique_content_bytes']:14,} bytes  dedup ratio {stats['dedup_ratio']:.2f}x")
+        print(f"  stored (gzip)        {stats['stored_bytes']:14,} bytes")
+        print(f"  saved by dedup       {stats['bytes_saved']:14,} bytes")
+        print(f"  shares/ on disk      {disk_usage(os.path.join(workdir, 'shares')):14,} bytes")
+        print(f"  read back            {'ok' if not differs else f'{differs} shares differ'}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
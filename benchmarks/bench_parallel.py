@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark --jobs on a simulated slow filesystem.
+
+Every os.scandir and os.open call is delayed by a fixed latency, standing in
+for a round trip to an NFS or SSHFS server, and the same tree is mapped with
+an increasing number of jobs. The output of every run is checked against the
+single-threaded walk.
+
+Usage:
+    python3 benchmarks/bench_parallel.py                       # 2ms latency, 2000 entries
+    python3 benchmarks/bench_parallel.py --latency 5 --entries 5000
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from bench_walker import build_tree, load_script
+
+JOB_COUNTS = [1, 2, 4, 8, 16]
+
+@contextmanager
+def injected_latency(seconds):
+    """Delay every directory open and listing by `seconds`."""
+    originals = {name: getattr(os, name) for name in ('scandir', 'open')}
+
+    def wrap(original):
+        def slow(*args, **kwargs):
+            time.sleep(seconds)
+            return original(*args, **kwargs)
+        return slow
+
+    for name, original in originals.items():
+        setattr(os, name, wrap(original))
+    try:
+        yield
+    finally:
+        for name, original in originals.items():
+            setattr(os, name, original)
+
+def main():
+    latency_ms = 2.0
+    entries = 2000
+    args = sys.argv[1:]
+    i = 0
+    while i < len(args):
+        if args[i] == '--latency' and i + 1 < len(args):
+            latency_ms = float(args[i + 1])
+            i += 2
+        elif args[i] == '--entries' and i + 1 < len(args):
+            entries = int(args[i + 1])
+            i += 2
+        else:
+            i += 1
+
+    structure = load_script('structure.py', 'structure')
+    root = tempfile.mkdtemp(prefix='structure-bench-')
+    try:
+        created = build_tree(root, entries)
+        expected = structure.generate_tree(root)
+        print(f"{created:,} entries, {len(expected):,} lines, {latency_ms}ms per call")
+        baseline = None
+        for jobs in JOB_COUNTS:
+            with injected_latency(latency_ms / 1000):
+                start = time.perf_counter()
+                lines = [structure.render_line(node) for node in structure.iter_tree(root, jobs=jobs)]
+                elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            status = "ok" if lines == expected else "OUTPUT DIFFERS"
+            print(f"  jobs={jobs:<3} {elapsed:8.3f}s  speedup {baseline / elapsed:5.2f}x  {status}")
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == "__main__":
+    main()
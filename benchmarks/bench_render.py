@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Measure what serving a share page costs per KB of tree text.
+
+Shares of increasing size are uploaded through app.py's /api/share (using
+Flask's test client, in a scratch directory), and each page /<id> is then
+fetched repeatedly, first with the page cache disabled, so every request
+renders view.html, and then with it enabled. Reports the time per request
+and per KB of tree text for both, and checks that the cached page is the
+same as the rendered one.
+
+Usage:
+    python3 benchmarks/bench_render.py                     # 10 KB to 10 MB
+    python3 benchmarks/bench_render.py 100 1000 --requests 50
+"""
+import io
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from bench_storage import load_app
+
+SIZES_KB = [10, 100, 1000, 10000]
+LINE = "│   ├── <component_{:08d}>.tsx\n"
+
+def tree_text(size_kb):
+    """About size_kb KB of tree text, with characters that need escaping."""
+    lines = []
+    length = 0
+    while length < size_kb * 1024:
+        line = LINE.format(len(lines))
+        lines.append(line)
+        length += len(line.encode('utf-8'))
+    return ''.join(lines).encode('utf-8')
+
+def time_page(client, url, requests):
+    """Seconds per request for url, and the last page served."""
+    start = time.perf_counter()
+    for _ in range(requests):
+        page = client.get(url).get_data()
+    return (time.perf_counter() - start) / requests, page
+
+def main():
+    sizes = []
+    requests = 20
+    args = sys.argv[1:]
+    i = 0
+    while i < len(args):
+        if args[i] == '--requests' and i + 1 < len(args):
+            requests = int(args[i + 1])
+            i += 2
+        else:
+            sizes.append(float(args[i]))
+            i += 1
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='structure-app-')
+    try:
+        app = load_app(workdir)
+        client = app.app.test_client()
+        max_entries = app.page_cache.max_entries
+        print(f"{'tree text':>12} {'uncached':>12} {'per KB':>10} {'cached':>12} {'per KB':>10}  speedup")
+        for size_kb in sizes or SIZES_KB:
+            text = tree_text(size_kb)
+            response = client.post('/api/share', data={'project': 'bench', 'content': (io.BytesIO(text), 'structure.txt')})
+            url = '/' + response.get_data(as_text=True).rsplit('/', 1)[-1]
+            kb = len(text) / 1024
+
+            app.page_cache.max_entries = 0
+            uncached, rendered = time_page(client, url, requests)
+            app.page_cache.max_entries = max_entries
+            client.get(url)
+            cached, page = time_page(client, url, requests)
+
+            status = "" if page == rendered else "  PAGE DIFFERS"
+            print(f"{kb:9,.0f} KB {uncached * 1e3:9.2f} ms {uncached * 1e6 / kb:7.2f} us "
+                  f"{cached * 1e3:9.2f} ms {cached * 1e6 / kb:7.2f} us  {uncached / cached:6.1f}x{status}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Compare tail latency of the serving modes while slow clients are connected.
+
+Each mode runs app.py with the same number of processes:
+
+    sync     gunicorn with sync workers, as in the Dockerfile
+    gthread  gunicorn with threaded workers
+    asgi     uvicorn running asgi.py
+
+For each mode, a large share and a small one are uploaded. Slow clients are
+then started: half download the large share a few KB at a time, and half
+trickle an upload. While they hold their connections, fast clients fetch
+the small share's /raw/<id> and /<id> pages in a loop. The report gives
+the latency percentiles of the fast requests, and how many of them failed
+or took longer than the timeout.
+
+Usage:
+    python3 benchmarks/bench_slow_clients.py
+    python3 benchmarks/bench_slow_clients.py --modes sync,asgi --slow 32 --fast 8 --seconds 20
+"""
+import os
+import sys
+import time
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+from urllib import request
+
+from bench_app import REPO_DIR, SAMPLE, free_port, prepare, upload
+
+MODES = ('sync', 'gthread', 'asgi')
+LARGE_LINES = 400_000
+TIMEOUT = 10.0
+
+def command(mode, port, workers):
+    """The server command line for a mode."""
+    bind = ['--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning']
+    if mode == 'sync':
+        return [sys.executable, '-m', 'gunicorn'] + bind + ['app:app']
+    if mode == 'gthread':
+        return [sys.executable, '-m', 'gunicorn'] + bind + ['--threads', '4', 'app:app']
+    return [sys.executable, '-m', 'uvicorn', '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(workers), '--log-level', 'warning', 'asgi:app']
+
+def start(mode, workdir, port, workers):
+    """Run the server for a mode and wait until it accepts connections."""
+    process = subprocess.Popen(command(mode, port, workers), cwd=workdir)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+def slow_download(port, path, stop):
+    """Read a response a few KB at a time until stopped."""
+    while not stop.is_set():
+        try:
+            sock = socket.socket()
+            # A small receive window makes the server wait on this client
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            sock.settimeout(TIMEOUT)
+            sock.connect(('127.0.0.1', port))
+            sock.sendall(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode())
+            while not stop.is_set() and sock.recv(4096):
+                time.sleep(0.05)
+            sock.close()
+        except OSError:
+            time.sleep(0.1)
+
+def slow_upload(port, stop):
+    """Trickle a share upload, 1 KB every 100 ms, until stopped."""
+    body = b"x" * (1024 * 1024)
+    while not stop.is_set():
+        try:
+            sock = socket.create_connection(('127.0.0.1', port), timeout=TIMEOUT)
+            head = (f'--b\r\nContent-Disposition: form-data; name="content"; filename="s.txt"\r\n\r\n').encode()
+            sock.sendall((f"POST /api/share HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n"
+                          f"Content-Type: multipart/form-data; boundary=b\r\n"
+                          f"Content-Length: {len(head) + len(body) + 8}\r\n\r\n").encode() + head)
+            sent = 0
+            while not stop.is_set() and sent < len(body):
+                sock.sendall(body[sent:sent + 1024])
+                sent += 1024
+                time.sleep(0.1)
+            sock.close()
+        except OSError:
+            time.sleep(0.1)
+
+def fast_client(urls, stop, latencies, failures):
+    """Fetch the urls in turn, recording the latency of each request."""
+    i = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            with request.urlopen(urls[i % len(urls)], timeout=TIMEOUT) as response:
+                response.read()
+            latencies.append(time.perf_counter() - start)
+        except OSError:
+            failures.append(time.perf_counter() - start)
+        i += 1
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+def measure(mode, options, large):
+    workdir = tempfile.mkdtemp(prefix='structure-app-')
+    port = free_port()
+    process = None
+    stop = threading.Event()
+    threads = []
+    try:
+        with open(os.path.join(REPO_DIR, 'app.py'), encoding='utf-8') as f:
+            prepare(workdir, f.read())
+        process = start(mode, workdir, port, options['workers'])
+        base_url = f"http://127.0.0.1:{port}"
+        large_id = upload(base_url, large)
+        small_id = upload(base_url, SAMPLE)
+
+        for n in range(options['slow']):
+            if n % 2:
+                target, args = slow_upload, (port, stop)
+            else:
+                target, args = slow_download, (port, f"/raw/{large_id}", stop)
+            threads.append(threading.Thread(target=target, args=args, daemon=True))
+        # Let the slow clients take their connections first
+        for thread in threads:
+            thread.start()
+        time.sleep(1)
+
+        latencies = []
+        failures = []
+        urls = [f"{base_url}/raw/{small_id}", f"{base_url}/{small_id}"]
+        fast = [threading.Thread(target=fast_client, args=(urls, stop, latencies, failures), daemon=True)
+                for _ in range(options['fast'])]
+        for thread in fast:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in fast:
+            thread.join()
+
+        latencies.sort()
+        print(f"{mode:<8} {len(latencies):8,} {percentile(latencies, 0.5) * 1e3:9.1f} "
+              f"{percentile(latencies, 0.95) * 1e3:9.1f} {percentile(latencies, 0.99) * 1e3:9.1f} "
+              f"{(latencies[-1] if latencies else float('nan')) * 1e3:9.1f} {len(failures):8,}")
+    finally:
+        stop.set()
+        if process is not None:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(workdir)
+
+def main():
+    options = {'workers': 2, 'slow': 16, 'fast': 4, 'seconds': 10.0}
+    modes = MODES
+    args = sys.argv[1:]
+    i = 0
+    while i < len(args):
+        if args[i] == '--modes' and i + 1 < len(args):
+            modes = args[i + 1].split(',')
+            i += 2
+        elif args[i] in ('--workers', '--slow', '--fast') and i + 1 < len(args):
+            options[args[i][2:]] = int(args[i + 1])
+            i += 2
+        elif args[i] == '--seconds' and i + 1 < len(args):
+            options['seconds'] = float(args[i + 1])
+            i += 2
+        else:
+            i += 1
+
+    large = "\n".join(["project/"] + [f"├── file_{i:07d}.py" for i in range(LARGE_LINES)])
+    print(f"{options['workers']} processes, {options['slow']} slow clients, "
+          f"{options['fast']} fast clients, {options['seconds']:g}s per mode")
+    print(f"{'mode':<8} {'requests':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'failed':>8}")
+    for mode in modes:
+        measure(mode, options, large)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Measure share storage and transfer sizes for large generated trees.
+
+Each tree (a generated one, or an existing directory given by path) is
+mapped with structure.py, uploaded through app.py's /api/share
+(using Flask's test client, in a scratch directory), and then fetched from
+/raw/<id> with and without Accept-Encoding: gzip. Reports the size of the
+tree text, the stored file, and the bytes on the wire for both clients, and
+checks that both decode to the original text. If the brotli module is
+installed, its size is shown for comparison.
+
+Usage:
+    python3 benchmarks/bench_storage.py                   # 10k and 100k entries
+    python3 benchmarks/bench_storage.py 10000 1000000     # custom sizes
+    python3 benchmarks/bench_storage.py /usr/lib          # a real tree
+"""
+import io
+import os
+import sys
+import gzip
+import shutil
+import hashlib
+import tempfile
+import importlib.util
+
+from bench_walker import build_tree, load_script
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SIZES = [10_000, 100_000]
+
+def load_app(workdir):
+    """Import app.py with workdir as the current directory, where it keeps its data."""
+    os.chdir(workdir)
+    # app.py imports the modules beside it
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    spec = importlib.util.spec_from_file_location('share_app', os.path.join(REPO_DIR, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    # Flask finds its templates next to the module it is registered as
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def main():
+    corpus = sys.argv[1:] or SIZES
+    structure = load_script('structure.py', 'structure')
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='structure-app-')
+    try:
+        app = load_app(workdir)
+        client = app.app.test_client()
+        for item in corpus:
+            if os.path.isdir(str(item)):
+                text = '\n'.join(structure.generate_tree(item)).encode('utf-8')
+                label = item
+            else:
+                root = tempfile.mkdtemp(prefix='structure-bench-')
+                try:
+                    label = f"{build_tree(root, int(item)):,} entries"
+                    text = '\n'.join(structure.generate_tree(root)).encode('utf-8')
+                finally:
+                    shutil.rmtree(root)
+
+            response = client.post('/api/share', data={'project': 'bench', 'content': (io.BytesIO(text), 'structure.txt')})
+            share_id = response.get_data(as_text=True).rsplit('/', 1)[-1]
+            # Content is stored once, under its hash
+            stored = os.path.join(workdir, app.share_path(hashlib.sha256(text).hexdigest(), '.txt.gz'))
+            stored_size = os.path.getsize(stored)
+
+            plain = client.get(f'/raw/{share_id}').get_data()
+            encoded = client.get(f'/raw/{share_id}', headers={'Accept-Encoding': 'gzip'}).get_data()
+            status = "ok" if plain == text and gzip.decompress(encoded) == text else "CONTENT DIFFERS"
+
+            print(f"{label}, {len(text):,} bytes of tree text")
+            print(f"  on disk              {stored_size:14,} bytes  {len(text) / stored_size:6.1f}x smaller")
+            print(f"  wire, identity       {len(plain):14,} bytes")
+            print(f"  wire, gzip           {len(encoded):14,} bytes  {status}")
+            if brotli is not None:
+                print(f"  brotli (reference)   {len(brotli.compress(text)):14,} bytes")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Measure time-to-first-line and peak memory of the streaming tree output.
+
+For each tree size this reports how long iter_tree takes to produce its
+first lines, and the peak traced memory of writing the whole tree through
+write_lines compared with building the full list and joining it.
+
+Usage:
+    python3 benchmarks/bench_streaming.py                 # 10k, 100k and 1M entries
+    python3 benchmarks/bench_streaming.py 10000 50000     # custom sizes
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import tracemalloc
+from itertools import islice
+
+from bench_walker import DEFAULT_SIZES, build_tree, load_script
+
+FIRST_LINES = 100
+
+def time_to_first(structure, root, count):
+    """Seconds until iter_tree has produced `count` rendered lines."""
+    start = time.perf_counter()
+    for node in islice(structure.iter_tree(root), count):
+        structure.render_line(node)
+    return time.perf_counter() - start
+
+def peak_memory(func):
+    """Peak traced memory in bytes while running func."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    structure = load_script('structure.py', 'structure')
+
+    for size in sizes:
+        root = tempfile.mkdtemp(prefix='structure-bench-')
+        try:
+            created = build_tree(root, size)
+            print(f"{created:,} entries")
+            first = time_to_first(structure, root, 1)
+            first_n = time_to_first(structure, root, FIRST_LINES)
+            print(f"  first line           {first * 1000:8.3f} ms")
+            print(f"  first {FIRST_LINES} lines       {first_n * 1000:8.3f} ms")
+
+            with open(os.devnull, 'w', encoding='utf-8') as devnull:
+                streamed = peak_memory(lambda: structure.write_lines(
+                    devnull, (structure.render_line(node) for node in structure.iter_tree(root))))
+                buffered = peak_memory(lambda: devnull.write('\n'.join(structure.generate_tree(root))))
+            print(f"  peak memory streamed {streamed / 1024:10,.0f} KiB")
+            print(f"  peak memory buffered {buffered / 1024:10,.0f} KiB")
+        finally:
+            shutil.rmtree(root)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Check that sharing large trees keeps memory flat on both ends.
+
+Starts app.py under gunicorn (one worker) with a 150 MB upload limit, then
+uploads generated trees of increasing size with structure-direct.py's
+share_structure, fed from a generator. After each upload it reports the
+client's and the worker's peak RSS, and checks that the stored share matches.
+Finally it declares a body over the limit and times the 413, which should
+arrive before any of the body is sent.
+
+Usage:
+    python3 benchmarks/bench_upload.py                 # 10 MB and 100 MB
+    python3 benchmarks/bench_upload.py 1 50 200        # custom sizes in MB
+"""
+import os
+import sys
+import time
+import gzip
+import shutil
+import hashlib
+import resource
+import tempfile
+import http.client
+
+from bench_app import REPO_DIR, free_port, prepare, start_server
+from bench_walker import load_script
+
+LIMIT_MB = 150
+LINE = "│   │   ├── component_{:08d}.tsx\n"
+
+def tree_chunks(size, chunk_size=64 * 1024):
+    """Yield about `size` bytes of tree text in chunks."""
+    sent = 0
+    i = 0
+    while sent < size:
+        chunk = ''.join(LINE.format(n) for n in range(i, i + 1000)).encode('utf-8')[:chunk_size]
+        i += 1000
+        sent += len(chunk)
+        yield chunk
+
+def gzip_chunks(path, chunk_size=64 * 1024):
+    with gzip.open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def digest(chunks):
+    h = hashlib.sha256()
+    for chunk in chunks:
+        h.update(chunk)
+    return h.digest()
+
+def peak_rss_kb(pid=None):
+    """Peak resident set size in KiB of this process, or of another one from /proc."""
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    return 0
+
+def worker_pid(master_pid):
+    """The pid of the single gunicorn worker under master_pid."""
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            try:
+                with open(f'/proc/{name}/stat') as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == master_pid:
+                        return int(name)
+            except (OSError, ValueError, IndexError):
+                pass
+    return None
+
+def main():
+    sizes_mb = [float(arg) for arg in sys.argv[1:]] or [10, 100]
+    direct = load_script('structure-direct.py', 'structure_direct')
+    workdir = tempfile.mkdtemp(prefix='structure-app-')
+    port = free_port()
+    process = None
+    try:
+        with open(os.path.join(REPO_DIR, 'app.py'), encoding='utf-8') as f:
+            prepare(workdir, f.read())
+        process = start_server(workdir, port, 1, 2, {'SHARE_MAX_UPLOAD_BYTES': str(LIMIT_MB * 1024 * 1024)})
+        url = f"http://127.0.0.1:{port}/api/share"
+        worker = worker_pid(process.pid)
+
+        for size_mb in sizes_mb:
+            size = int(size_mb * 1024 * 1024)
+            start = time.perf_counter()
+            result = direct.share_structure(tree_chunks(size), 'bench', url)
+            elapsed = time.perf_counter() - start
+            client_rss = peak_rss_kb()
+            # Content is stored once, under its hash
+            expected = digest(tree_chunks(size))
+            stored = os.path.join(workdir, 'shares', expected.hex()[:2], expected.hex()[2:4], f"{expected.hex()}.txt.gz")
+            if os.path.exists(stored):
+                status = "ok" if digest(gzip_chunks(stored)) == expected else "CONTENT DIFFERS"
+            else:
+                status = result
+            print(f"{size_mb:g} MB upload in {elapsed:.2f}s  {status}")
+            print(f"  client peak RSS  {client_rss / 1024:8.1f} MB")
+            if worker is not None:
+                print(f"  worker peak RSS  {peak_rss_kb(worker) / 1024:8.1f} MB")
+
+        # Declare a body over the limit and wait for the answer before sending it
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        start = time.perf_counter()
+        conn.putrequest('POST', '/api/share')
+        conn.putheader('Content-Type', 'multipart/form-data; boundary=x')
+        conn.putheader('Content-Length', str((LIMIT_MB + 1) * 1024 * 1024))
+        conn.endheaders()
+        response = conn.getresponse()
+        print(f"over-limit upload: {response.status} after {(time.perf_counter() - start) * 1000:.1f} ms, "
+              f"no body sent")
+        conn.close()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Benchmark the scandir walker against the original listdir/isdir recursion.
+
+Builds synthetic trees with the requested number of entries, maps each one
+with the legacy implementation and with structure.py / structure-direct.py,
+and reports wall time plus the number of filesystem calls made.
+
+Usage:
+    python3 benchmarks/bench_walker.py                  # 10k, 100k and 1M entries
+    python3 benchmarks/bench_walker.py 10000 50000      # custom sizes
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import importlib.util
+from contextlib import contextmanager
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+FILES_PER_DIR = 40
+DIRS_PER_DIR = 6
+
+def load_script(filename, module_name):
+    """Import one of the standalone scripts as a module."""
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(SCRIPTS_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def legacy_generate_tree(directory, prefix="", is_last=True, ignore_dirs=None):
+    """The listdir + isdir recursion the scripts used before the scandir walker."""
+    if ignore_dirs is None:
+        ignore_dirs = ['.git', '__pycache__', 'venv', 'env', '.venv', 'node_modules']
+    output = []
+    base_name = os.path.basename(directory)
+    if prefix == "":
+        output.append(f"{base_name}/")
+        new_prefix = ""
+    elif is_last:
+        output.append(f"{prefix}└── {base_name}/")
+        new_prefix = prefix + "    "
+    else:
+        output.append(f"{prefix}├── {base_name}/")
+        new_prefix = prefix + "│   "
+    try:
+        items = sorted([item for item in os.listdir(directory)
+                      if not item.startswith('.') or item == '.env.example'])
+        filtered_items = []
+        for item in items:
+            item_path = os.path.join(directory, item)
+            if os.path.isdir(item_path) and item in ignore_dirs:
+                continue
+            filtered_items.append(item)
+        dirs = [item for item in filtered_items if os.path.isdir(os.path.join(directory, item))]
+        files = [item for item in filtered_items if not os.path.isdir(os.path.join(directory, item))]
+        all_items = dirs + files
+        for i, item in enumerate(all_items):
+            item_path = os.path.join(directory, item)
+            is_current_last = (i == len(all_items) - 1)
+            if os.path.isdir(item_path):
+                output.extend(legacy_generate_tree(item_path, new_prefix, is_current_last, ignore_dirs))
+            elif is_current_last:
+                output.append(f"{new_prefix}└── {item}")
+            else:
+                output.append(f"{new_prefix}├── {item}")
+    except PermissionError:
+        output.append(f"{new_prefix}├── Access Denied")
+    except Exception as e:
+        output.append(f"{new_prefix}├── Error: {str(e)}")
+    return output
+
+def build_tree(root, total_entries):
+    """Create a synthetic tree with roughly total_entries files and directories."""
+    created = 0
+    pending = [root]
+    while pending and created < total_entries:
+        directory = pending.pop(0)
+        for d in range(DIRS_PER_DIR):
+            if created >= total_entries:
+                break
+            path = os.path.join(directory, f"dir_{d:02d}")
+            os.mkdir(path)
+            pending.append(path)
+            created += 1
+        for f in range(FILES_PER_DIR):
+            if created >= total_entries:
+                break
+            open(os.path.join(directory, f"file_{f:03d}.py"), 'w').close()
+            created += 1
+    return created
+
+@contextmanager
+def count_fs_calls():
+    """
+    Count the filesystem calls made through the os module.
+
+    os.path.isdir goes through os.stat, so each isdir shows up as a stat.
+    DirEntry.is_dir answers from the d_type returned by the listing and
+    makes no call at all on Linux and macOS, so it is not counted. The
+    walkers open each directory and close it again, so os.open and os.close
+    count as well.
+    """
+    counts = {'listdir': 0, 'scandir': 0, 'stat': 0, 'open': 0, 'close': 0}
+    originals = {name: getattr(os, name) for name in counts}
+
+    def wrap(name):
+        original = originals[name]
+
+        def counted(*args, **kwargs):
+            counts[name] += 1
+            return original(*args, **kwargs)
+        return counted
+
+    for name in counts:
+        setattr(os, name, wrap(name))
+    try:
+        yield counts
+    finally:
+        for name, original in originals.items():
+            setattr(os, name, original)
+
+def entry_names(lines):
+    """Strip the tree drawing from each line, leaving the entry names in order."""
+    return [line.lstrip('│├└─ ') for line in lines]
+
+def run(label, func, root):
+    with count_fs_calls() as counts:
+        start = time.perf_counter()
+        result = func(root)
+        elapsed = time.perf_counter() - start
+    calls = sum(counts.values())
+    print(f"  {label:<22} {elapsed:8.3f}s  {calls:>10,} fs calls  "
+          f"(listdir={counts['listdir']:,} scandir={counts['scandir']:,} stat={counts['stat']:,} "
+          f"open={counts['open']:,} close={counts['close']:,})")
+    return result
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    structure = load_script('structure.py', 'structure')
+    structure_direct = load_script('structure-direct.py', 'structure_direct')
+
+    for size in sizes:
+        root = tempfile.mkdtemp(prefix='structure-bench-')
+        try:
+            created = build_tree(root, size)
+            print(f"{created:,} entries")
+            legacy = run('legacy listdir+isdir', legacy_generate_tree, root)
+            current = run('structure.py', structure.generate_tree, root)
+            _, plain = run('structure-direct.py',
+                           lambda path: structure_direct.generate_tree(path, use_colors=False), root)
+            # The legacy code drew the root's subdirectories without connectors,
+            # so compare the entries rather than the exact lines
+            if entry_names(legacy) != entry_names(current) or current != plain:
+                print("  WARNING: output differs from the legacy implementation")
+        finally:
+            shutil.rmtree(root)
+
+if __name__ == "__main__":
+    main()
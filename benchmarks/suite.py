@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Reproducible benchmark suite for the walker scripts and the share service.
+
+`run` builds synthetic trees of three shapes and times the command-line
+scripts on them, then starts app.py and replays an upload and view
+workload against it. The results are written as JSON, tagged with the
+commit they were measured at. `compare` compares two result files.
+
+Tree shapes:
+    wide    one directory of files, plus a few small subdirectories
+    deep    a chain of nested directories, a few files at each level
+    mixed   6 subdirectories and 40 files per directory, breadth first
+
+Walker results: the median wall time of each script run (as a separate
+process, output discarded) and its peak RSS. Service results: for each
+phase of the workload, throughput and p50/p99 latency; and the peak RSS of
+the server workers. Trees and workloads come from a fixed seed, so runs on
+different commits do the same work. A workload can also be saved and
+replayed from a file.
+
+Usage:
+    python3 benchmarks/suite.py run                          # writes benchmarks/results/<commit>.json
+    python3 benchmarks/suite.py run --quick --only walker
+    python3 benchmarks/suite.py run --mode asgi --output after.json
+    python3 benchmarks/suite.py run --save-workload workload.json
+    python3 benchmarks/suite.py run --workload workload.json
+    python3 benchmarks/suite.py compare benchmarks/results/abc1234.json after.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from urllib import request
+from urllib.error import HTTPError
+
+from bench_app import REPO_DIR, free_port, prepare, upload
+from bench_walker import build_tree
+from bench_slow_clients import start
+
+SCRIPTS_DIR = os.path.join(REPO_DIR, 'scripts')
+RESULTS_DIR = os.path.join(REPO_DIR, 'benchmarks', 'results')
+SEED = 20240601
+FORMAT_VERSION = 1
+
+# Entries per shape, full and --quick
+SHAPES = {
+    'wide': {'full': 50_000, 'quick': 5_000},
+    'deep': {'full': 400, 'quick': 100},
+    'mixed': {'full': 100_000, 'quick': 10_000},
+}
+# Uploads and page/raw requests in the service workload, full and --quick
+WORKLOAD = {'full': (200, 5_000), 'quick': (40, 1_000)}
+# Changes smaller than this are reported as noise by compare
+NOISE = 0.05
+
+def build_wide(root, entries):
+    """One directory holding nearly all the entries, plus ten small subdirectories."""
+    for d in range(10):
+        path = os.path.join(root, f"dir_{d:02d}")
+        os.mkdir(path)
+        for f in range(10):
+            open(os.path.join(path, f"file_{f:02d}.txt"), 'w').close()
+    for f in range(entries - 110):
+        open(os.path.join(root, f"file_{f:06d}.py"), 'w').close()
+    return max(entries, 110)
+
+def build_deep(root, levels):
+    """A chain of `levels` nested directories with three files at each level."""
+    directory = root
+    for level in range(levels):
+        for f in range(3):
+            open(os.path.join(directory, f"file_{f}.py"), 'w').close()
+        directory = os.path.join(directory, f"d{level % 10}")
+        os.mkdir(directory)
+    return levels * 4
+
+BUILDERS = {'wide': build_wide, 'deep': build_deep, 'mixed': build_tree}
+
+def run_process(args, env=None):
+    """
+    Run a command with its output discarded.
+
+    Returns:
+        tuple: (wall seconds, peak RSS in KiB)
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL, env=env)
+    # wait4 reports the child's own peak RSS, not this process's
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    if status != 0:
+        raise RuntimeError(f"{' '.join(args)} exited with status {os.waitstatus_to_exitcode(status)}")
+    return elapsed, usage.ru_maxrss
+
+def walker_commands(root, workdir):
+    """The script invocations timed on each tree, as (name, args, env, warm-up runs)."""
+    out = os.path.join(workdir, 'structure.txt')
+    structure = [sys.executable, os.path.join(SCRIPTS_DIR, 'structure.py'), root, out, '']
+    direct = [sys.executable, os.path.join(SCRIPTS_DIR, 'structure-direct.py'), root, '--no-color']
+    # The scan cache goes to a scratch directory, never the user's
+    cached_env = dict(os.environ, XDG_CACHE_HOME=os.path.join(workdir, 'cache'))
+    return [
+        ('structure.py', structure + ['--no-cache'], None, 0),
+        ('structure.py -j 8', structure + ['--no-cache', '-j', '8'], None, 0),
+        ('structure.py cached', structure, cached_env, 1),
+        ('structure-direct.py', direct, None, 0),
+    ]
+
+def run_walker(results, size, repeat):
+    for shape, builder in BUILDERS.items():
+        workdir = tempfile.mkdtemp(prefix='structure-suite-')
+        try:
+            root = os.path.join(workdir, shape)
+            os.mkdir(root)
+            entries = builder(root, SHAPES[shape][size])
+            for name, args, env, warmup in walker_commands(root, workdir):
+                for _ in range(warmup):
+                    run_process(args, env)
+                times = []
+                peak = 0
+                for _ in range(repeat):
+                    elapsed, rss = run_process(args, env)
+                    times.append(elapsed)
+                    peak = max(peak, rss)
+                times.sort()
+                key = f"walker/{shape}/{name}"
+                results[key] = {
+                    'entries': entries,
+                    'seconds': times[len(times) // 2],
+                    'min_seconds': times[0],
+                    'peak_rss_kb': peak,
+                }
+                print(f"  {key:<40} {results[key]['seconds']:8.3f}s  {peak / 1024:7.1f} MB")
+        finally:
+            shutil.rmtree(workdir)
+
+def tree_text(lines, seed):
+    """Tree text with the given number of lines, the same for the same seed."""
+    rng = random.Random(seed)
+    out = [f"project-{seed}/"]
+    for i in range(lines):
+        depth = rng.randint(0, 3)
+        out.append("│   " * depth + "├── " + f"module_{rng.randrange(10 ** 6):06d}.py")
+    return "\n".join(out)
+
+def generate_workload(uploads, requests_count, seed=SEED):
+    """
+    A workload as a list of operations.
+
+    Uploads come first, with sizes from 10 to 20,000 lines (log-uniform) and
+    one in five repeating an earlier upload. Then pages and raw text are
+    requested, 70/30, with a few shares getting most of the requests.
+    """
+    rng = random.Random(seed)
+    ops = []
+    for n in range(uploads):
+        if n and rng.random() < 0.2:
+            ops.append({'op': 'upload', 'copy_of': rng.randrange(n)})
+        else:
+            ops.append({'op': 'upload', 'lines': int(10 ** rng.uniform(1, 4.3)), 'seed': rng.randrange(10 ** 9)})
+    weights = [1 / (rank + 1) for rank in range(uploads)]
+    for share in rng.choices(range(uploads), weights=weights, k=requests_count):
+        ops.append({'op': 'view' if rng.random() < 0.7 else 'raw', 'share': share})
+    return ops
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+def replay(ops, clients):
+    """
+    Call each of a list of functions once, from `clients` threads.
+
+    Returns:
+        dict: requests, errors, throughput and p50/p99 latency in ms
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def client(n):
+        for op in ops[n::clients]:
+            start = time.perf_counter()
+            try:
+                op()
+            except (HTTPError, OSError):
+                with lock:
+                    errors[0] += 1
+                continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': len(ops),
+        'errors': errors[0],
+        'throughput_rps': len(ops) / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1e3,
+        'p99_ms': percentile(latencies, 0.99) * 1e3,
+    }
+
+def process_tree_hwm(pid):
+    """Peak RSS in KiB of a process and of each of its children, from /proc."""
+    peaks = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+            if int(name) != pid and parent != pid:
+                continue
+            with open(f'/proc/{name}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        peaks[int(name)] = int(line.split()[1])
+        except (OSError, ValueError, IndexError):
+            pass
+    return peaks
+
+def run_service(results, ops, mode, workers, clients):
+    workdir = tempfile.mkdtemp(prefix='structure-app-')
+    port = free_port()
+    process = None
+    try:
+        with open(os.path.join(REPO_DIR, 'app.py'), encoding='utf-8') as f:
+            prepare(workdir, f.read())
+        process = start(mode, workdir, port, workers)
+        base_url = f"http://127.0.0.1:{port}"
+
+        # Uploads run in order, so a copy can name the share it repeats
+        contents = []
+        share_ids = []
+        upload_ops = []
+        for op in ops:
+            if op['op'] != 'upload':
+                continue
+            content = contents[op['copy_of']] if 'copy_of' in op else tree_text(op['lines'], op['seed'])
+            contents.append(content)
+            upload_ops.append(content)
+
+        def do_upload(content):
+            share_ids.append(upload(base_url, content))
+        results['service/upload'] = replay([lambda c=c: do_upload(c) for c in upload_ops], 1)
+
+        def fetch(url):
+            with request.urlopen(url) as response:
+                response.read()
+        reads = []
+        for op in ops:
+            if op['op'] in ('view', 'raw') and op['share'] < len(share_ids):
+                path = '/' if op['op'] == 'view' else '/raw/'
+                reads.append(lambda url=f"{base_url}{path}{share_ids[op['share']]}": fetch(url))
+        results['service/read'] = replay(reads, clients)
+
+        peaks = process_tree_hwm(process.pid)
+        workers_peak = [kb for pid, kb in peaks.items() if pid != process.pid] or list(peaks.values())
+        results['service/memory'] = {
+            'worker_peak_rss_kb': max(workers_peak) if workers_peak else None,
+            'total_peak_rss_kb': sum(peaks.values()),
+        }
+        for key in ('service/upload', 'service/read'):
+            r = results[key]
+            print(f"  {key:<40} {r['throughput_rps']:8,.0f} req/s  p50 {r['p50_ms']:7.2f} ms  "
+                  f"p99 {r['p99_ms']:7.2f} ms  {r['errors']} errors")
+        print(f"  {'service/memory':<40} worker peak {results['service/memory']['worker_peak_rss_kb'] / 1024:.1f} MB")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(workdir)
+
+def git(*args):
+    try:
+        return subprocess.run(['git'] + list(args), cwd=REPO_DIR, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    size = 'full'
+    only = None
+    repeat = 5
+    mode = 'gthread'
+    workers = 2
+    clients = 8
+    output = None
+    workload_file = None
+    save_workload = None
+    i = 0
+    while i < len(args):
+        if args[i] == '--quick':
+            size = 'quick'
+            i += 1
+        elif args[i] == '--only' and i + 1 < len(args):
+            only = args[i + 1]
+            i += 2
+        elif args[i] in ('--repeat', '--workers', '--clients') and i + 1 < len(args):
+            value = int(args[i + 1])
+            if args[i] == '--repeat':
+                repeat = value
+            elif args[i] == '--workers':
+                workers = value
+            else:
+                clients = value
+            i += 2
+        elif args[i] == '--mode' and i + 1 < len(args):
+            mode = args[i + 1]
+            i += 2
+        elif args[i] == '--output' and i + 1 < len(args):
+            output = args[i + 1]
+            i += 2
+        elif args[i] == '--workload' and i + 1 < len(args):
+            workload_file = args[i + 1]
+            i += 2
+        elif args[i] == '--save-workload' and i + 1 < len(args):
+            save_workload = args[i + 1]
+            i += 2
+        else:
+            i += 1
+
+    commit = git('rev-parse', '--short', 'HEAD')
+    report = {
+        'format': FORMAT_VERSION,
+        'commit': commit,
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'parameters': {'size': size, 'repeat': repeat, 'mode': mode, 'workers': workers,
+                       'clients': clients, 'seed': SEED, 'workload': workload_file},
+        'results': {},
+    }
+
+    if only in (None, 'walker'):
+        print(f"walker ({size}, median of {repeat})")
+        run_walker(report['results'], size, repeat)
+    if only in (None, 'service'):
+        if workload_file is not None:
+            with open(workload_file, encoding='utf-8') as f:
+                ops = json.load(f)
+        else:
+            ops = generate_workload(*WORKLOAD[size])
+        if save_workload is not None:
+            with open(save_workload, 'w', encoding='utf-8') as f:
+                json.dump(ops, f)
+        print(f"service ({mode}, {workers} workers, {clients} clients, {len(ops):,} operations)")
+        run_service(report['results'], ops, mode, workers, clients)
+
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{commit or 'unknown'}{'-dirty' if report['dirty'] else ''}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+def compare(old_path, new_path):
+    """Print each metric of two result files side by side, flagging changes beyond noise."""
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    for name in sorted(set(old['parameters']) | set(new['parameters'])):
+        if old['parameters'].get(name) != new['parameters'].get(name):
+            print(f"  note: {name} differs ({old['parameters'].get(name)} -> {new['parameters'].get(name)})")
+    for key in sorted(set(old['results']) & set(new['results'])):
+        for metric, before in old['results'][key].items():
+            after = new['results'][key].get(metric)
+            if metric in ('entries', 'requests') or not before or after is None:
+                continue
+            change = (after - before) / before
+            higher_is_better = metric.endswith('_rps')
+            verdict = ""
+            if abs(change) >= NOISE:
+                verdict = "better" if (change > 0) == higher_is_better else "worse"
+            print(f"  {key + ' ' + metric:<58} {before:12.4g} {after:12.4g} {change:+8.1%}  {verdict}")
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] == 'compare' and len(args) == 3:
+        compare(args[1], args[2])
+    elif args and args[0] == 'run':
+        run(args[1:])
+    else:
+        print(__doc__.strip().split('Usage:')[1].rstrip())
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
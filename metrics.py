@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Request and stage timings for the share service, in Prometheus text format.
+
+Metrics live in memory and are per process, so with several workers each
+scrape of /metrics sees the worker that answered it. Recording a value
+takes a bisect and a lock, about a microsecond, so the hooks can stay on
+the hot paths.
+
+SamplingProfiler samples the stacks of a worker's other threads for a
+while and returns them in collapsed form, as used by flame graph tools.
+"""
+import os
+import sys
+import time
+import bisect
+import threading
+from collections import Counter as StackCounter
+
+# Seconds; from a cache hit to a large upload
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bytes of tree text
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra=None):
+    """Format a label set, e.g. {route="/raw/<share_id>",le="0.5"}."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Timer:
+    """Observes the time spent in a with block."""
+    __slots__ = ('histogram', 'labels', 'start')
+    
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+class Histogram:
+    """Distribution of observed values, per label set, in fixed buckets."""
+    
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value, *label_values):
+        """Record one value."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+    
+    def time(self, *label_values):
+        """Context manager observing the seconds its block takes."""
+        return _Timer(self, label_values)
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((values, list(counts), total) for values, (counts, total) in self._series.items())
+        for values, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {cumulative}")
+        return lines
+
+class Counter:
+    """A count per label set that only goes up."""
+    
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {_number(value)}")
+        return lines
+
+class Gauge:
+    """
+    Values read when the metrics are scraped, from a function returning [(label values, value)].
+    
+    kind='counter' exposes totals kept elsewhere, such as a cache's hit count, as a counter.
+    """
+    
+    def __init__(self, name, documentation, labels, collect, kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.collect = collect
+        self.kind = kind
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, value in self.collect():
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {_number(value)}")
+        return lines
+
+class Registry:
+    """The metrics exposed together at one endpoint."""
+    
+    def __init__(self):
+        self.metrics = []
+    
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+    
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every other thread in this process at an interval.
+    
+    Only one sampling run happens at a time per process.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+    
+    def sample(self, seconds, interval):
+        """
+        Sample for a while.
+        
+        Args:
+            seconds (float): How long to sample
+            interval (float): Seconds between samples
+        
+        Returns:
+            Counter: Sample counts per stack, as 'outermost;...;innermost', or None
+                     if another run is in progress
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            stacks = StackCounter()
+            me = threading.get_ident()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    names = []
+                    while frame is not None:
+                        names.append(_frame_name(frame))
+                        frame = frame.f_back
+                    stacks[';'.join(reversed(names))] += 1
+                time.sleep(interval)
+            return stacks
+        finally:
+            self._lock.release()
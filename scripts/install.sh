@@ -35,8 +35,14 @@ fi
 # Parse command line arguments
 OUTPUT_FILE="structure.txt"
 DIRECTORY="."
+DIRECTORIES=()
+MANIFEST=""
+OUTPUT_DIR=""
 IGNORE=""
 SHARE=false
+JOBS=1
+EXTRA_ARGS=()
+FORMAT="ascii"
 
 while [[ $# -gt 0 ]]; do
     case $1 in
@@ -52,13 +58,51 @@ while [[ $# -gt 0 ]]; do
             SHARE=true
             shift
             ;;
+        -j|--jobs)
+            JOBS="$2"
+            shift 2
+            ;;
+        --no-cache|--clear-cache|--no-gitignore|--sizes)
+            EXTRA_ARGS+=("$1")
+            shift
+            ;;
+        --max-depth|--max-entries|--max-children)
+            EXTRA_ARGS+=("$1" "$2")
+            shift 2
+            ;;
+        --format)
+            FORMAT="$2"
+            EXTRA_ARGS+=("$1" "$2")
+            shift 2
+            ;;
+        --manifest)
+            MANIFEST="$2"
+            EXTRA_ARGS+=("$1" "$2")
+            shift 2
+            ;;
+        --output-dir)
+            OUTPUT_DIR="$2"
+            EXTRA_ARGS+=("$1" "$2")
+            shift 2
+            ;;
         -h|--help)
-            echo "Usage: structure [options] [directory]"
+            echo "Usage: structure [options] [directory ...]"
             echo ""
             echo "Options:"
             echo "  -o, --output FILE    Write output to FILE (default: structure.txt)"
-            echo "  -i, --ignore DIRS    Comma-separated list of directories to ignore"
+            echo "  -i, --ignore DIRS    Comma-separated directories or patterns (e.g. '*.log') to ignore"
             echo "  -s, --share          Generate a shareable URL at structure.sh"
+            echo "  -j, --jobs N         List directories on N threads (default: 1)"
+            echo "  --no-cache           Do not read or write the scan cache"
+            echo "  --clear-cache        Rebuild the scan cache from a full scan"
+            echo "  --no-gitignore       Do not apply .gitignore files"
+            echo "  --max-depth N        List at most N levels below the directory"
+            echo "  --max-entries N      Stop after N entries"
+            echo "  --max-children N     Show at most N entries per directory"
+            echo "  --sizes              Show file sizes and directory totals"
+            echo "  --format FORMAT      ascii (default), json or ndjson"
+            echo "  --manifest FILE      Also map every directory listed in FILE, one per line"
+            echo "  --output-dir DIR     With several directories, write one file per directory under DIR"
             echo "  -h, --help           Show this help message"
             echo ""
             echo "Examples:"
@@ -67,30 +111,46 @@ while [[ $# -gt 0 ]]; do
             echo "  structure -o output.txt        # Specify output file"
             echo "  structure -i node_modules,dist # Ignore additional directories"
             echo "  structure -s                   # Generate shareable URL"
+            echo "  structure --manifest pkgs.txt  # Map many directories in one run"
             exit 0
             ;;
         *)
-            DIRECTORY="$1"
+            DIRECTORIES+=("$1")
             shift
             ;;
     esac
 done
 
+# The first directory is passed as before, any others with --root
+if [ ${#DIRECTORIES[@]} -gt 0 ]; then
+    DIRECTORY="${DIRECTORIES[0]}"
+    for ROOT in "${DIRECTORIES[@]:1}"; do
+        EXTRA_ARGS+=("--root" "$ROOT")
+    done
+elif [ -n "$MANIFEST" ]; then
+    DIRECTORY=""
+fi
+
 # Run the structure.py script
-python3 "$HOME/.local/bin/structure.py" "$DIRECTORY" "$OUTPUT_FILE" "$IGNORE"
+python3 "$HOME/.local/bin/structure.py" "$DIRECTORY" "$OUTPUT_FILE" "$IGNORE" --jobs "$JOBS" "${EXTRA_ARGS[@]}"
 
 # Display the output file contents
-if [ -f "$OUTPUT_FILE" ]; then
+if [ -n "$OUTPUT_DIR" ]; then
+    echo "Structures have been saved under $OUTPUT_DIR"
+elif [ -f "$OUTPUT_FILE" ]; then
     echo ""
     cat "$OUTPUT_FILE"
     echo ""
     echo "Structure has been saved to $OUTPUT_FILE"
     
     # If share option is enabled, upload to server
-    if [ "$SHARE" = true ]; then
+    if [ "$SHARE" = true ] && [ "$FORMAT" != "ascii" ]; then
+        echo ""
+        echo "Only the ascii format can be shared."
+    elif [ "$SHARE" = true ]; then
         echo ""
         echo "Generating shareable link..."
-        PROJECT_NAME=$(basename "$(realpath "$DIRECTORY")")
+        PROJECT_NAME=$(basename "$(realpath "${DIRECTORY:-.}")")
         SHARE_URL=$(curl -s -F "content=@$OUTPUT_FILE" -F "project=$PROJECT_NAME" https://structure.sh/api/share)
         
         if [[ $SHARE_URL == https://structure.sh/* ]]; then
@@ -1,112 +1,1306 @@
 #!/usr/bin/env python3
 import os
+import errno
 import sys
+import re
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def generate_tree(directory, prefix="", is_last=True, ignore_dirs=None):
+DEFAULT_IGNORE_DIRS = ['.git', '__pycache__', 'venv', 'env', '.venv', 'node_modules']
+
+# List directories through file descriptors relative to their parent where the
+# platform allows it, so deep trees are not limited by the maximum path length
+USE_DIR_FD = os.scandir in os.supports_fd and os.open in os.supports_dir_fd
+
+def _descriptor_budget():
+    """Directory descriptors one walk may hold: a quarter of the process limit, at most 256."""
+    try:
+        import resource
+        limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    except (ImportError, OSError, ValueError):
+        return 256
+    if limit == resource.RLIM_INFINITY:
+        return 256
+    return max(8, min(256, limit // 4))
+
+# Past this many, the descriptors of directories further up the walk are
+# released, and reopened from one still held when the walk climbs back
+MAX_OPEN_DIRS = _descriptor_budget()
+
+class Node:
     """
-    Generate a tree structure for the given directory.
+    One entry of the walked tree, as yielded by iter_tree.
+    
+    A node holds the entry itself (name, kind, size, mtime) and where it sits
+    in the tree (depth, whether it is the last entry of its directory, the
+    path of that directory and the ASCII prefix drawn before it). Siblings
+    share the same parent and prefix strings. Every output format is
+    rendered from these.
+    
+    kind is 'dir', 'file', 'more' (entries cut by a limit) or 'error'.
+    size and mtime are only set when the walk collects stats. total_size and
+    file_count are set on directories with sizes, once the walk has left them.
+    """
+    __slots__ = ('name', 'kind', 'depth', 'is_last', 'parent', 'prefix', 'size', 'mtime',
+                 'total_size', 'file_count')
+    
+    def __init__(self, name, kind, depth, is_last, parent, prefix, stat=None):
+        self.name = name
+        self.kind = kind
+        self.depth = depth
+        self.is_last = is_last
+        self.parent = parent
+        self.prefix = prefix
+        if stat is None:
+            self.size = self.mtime = None
+        else:
+            self.size, self.mtime = stat
+        self.total_size = self.file_count = None
+    
+    @property
+    def connector(self):
+        """The branch drawn between the prefix and the name in the ASCII tree."""
+        if self.depth == 0:
+            return ""
+        if self.kind == 'error':
+            return "├── "
+        return "└── " if self.is_last else "├── "
+    
+    @property
+    def path(self):
+        """Path relative to the root; for 'more' and 'error' nodes, their directory's path."""
+        if self.depth == 0:
+            return "."
+        if self.kind not in ('dir', 'file'):
+            return self.parent or "."
+        return f"{self.parent}/{self.name}" if self.parent else self.name
+    
+    def record(self):
+        """The node as a dict for the JSON formats."""
+        record = {'name': self.name, 'type': self.kind}
+        if self.size is not None:
+            record['size'] = self.size
+        if self.mtime is not None:
+            record['mtime'] = self.mtime
+        if self.file_count is not None:
+            record['total_size'] = self.total_size
+            record['file_count'] = self.file_count
+        return record
+
+def scan_directory(directory, with_stats=False, stat_dirs=True):
+    """
+    List a directory once and classify every entry.
+    
+    Uses os.scandir so the entry type comes from the directory listing itself
+    (d_type on most filesystems) instead of a separate stat per entry.
     
     Args:
-        directory (str): The directory to map
-        prefix (str): The prefix to use for the current line
-        is_last (bool): Whether this is the last item in the current directory
-        ignore_dirs (list): List of directory names to ignore
+        directory (str or int): The directory path or an open directory descriptor
+        with_stats (bool): Whether to stat every entry for its size and mtime
+        stat_dirs (bool): With with_stats, whether directories are stat'ed as well as files
+    
+    Returns:
+        tuple: (dirs, files, has_gitignore, links, stats) with dirs and files as
+        sorted lists of names, links the names of dirs that are symlinks, and
+        stats mapping names to (size, mtime) or None
+    """
+    dirs = []
+    files = []
+    links = []
+    has_gitignore = False
+    stats = {} if with_stats else None
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            name = entry.name
+            if name.startswith('.') and name != '.env.example':
+                if name == '.gitignore':
+                    has_gitignore = True
+                continue
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                dirs.append(name)
+                if entry.is_symlink():
+                    links.append(name)
+            else:
+                files.append(name)
+            if with_stats and (stat_dirs or not is_dir):
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                    stats[name] = (st.st_size, st.st_mtime)
+                except OSError:
+                    pass
+    dirs.sort()
+    files.sort()
+    return dirs, files, has_gitignore, links, stats
+
+class IgnoreRules:
+    """
+    Compiled ignore patterns from one source, relative to the directory they came from.
+    
+    Patterns use .gitignore syntax. Plain names become set lookups and the
+    remaining globs are folded into one regex for names and one for paths,
+    each with a directory variant that also includes the directory-only
+    patterns. A source with negated patterns keeps them in order instead,
+    since the last matching pattern decides. Without negations, a pattern
+    ending in /** also marks the directories whose contents it ignores.
+    """
+    __slots__ = ('base', 'names', 'dir_names', 'name_regex', 'dir_name_regex',
+                 'path_regex', 'dir_path_regex', 'contents_regex', 'ordered', 'uses_paths')
+    
+    def __init__(self, base, patterns):
+        self.base = base
+        self.names = set()
+        self.dir_names = set()
+        self.name_regex = self.dir_name_regex = None
+        self.path_regex = self.dir_path_regex = None
+        self.contents_regex = None
+        self.ordered = None
+        
+        rules = [rule for rule in (_parse_pattern(p) for p in patterns) if rule is not None]
+        self.uses_paths = any(anchored for _, _, _, anchored, _ in rules)
+        if any(negate for _, negate, _, _, _ in rules):
+            self.ordered = [(re.compile(regex), negate, dir_only, anchored)
+                            for regex, negate, dir_only, anchored, _ in rules]
+            return
         
+        name_globs, dir_name_globs, path_globs, dir_path_globs, contents_globs = [], [], [], [], []
+        for regex, _, dir_only, anchored, literal in rules:
+            # "dir/**" ignores everything inside dir, though not dir itself
+            if anchored and not dir_only and regex.endswith('/.*') and len(regex) > 3:
+                contents_globs.append(regex[:-3])
+            if literal is not None and not anchored:
+                self.dir_names.add(literal)
+                if not dir_only:
+                    self.names.add(literal)
+            elif anchored:
+                dir_path_globs.append(regex)
+                if not dir_only:
+                    path_globs.append(regex)
+            else:
+                dir_name_globs.append(regex)
+                if not dir_only:
+                    name_globs.append(regex)
+        
+        def combine(regexes):
+            return re.compile('|'.join(f"(?:{regex})" for regex in regexes)) if regexes else None
+        self.name_regex = combine(name_globs)
+        self.dir_name_regex = combine(dir_name_globs)
+        self.path_regex = combine(path_globs)
+        self.dir_path_regex = combine(dir_path_globs)
+        self.contents_regex = combine(contents_globs)
+    
+    def relative_dir(self, key):
+        """Path of the directory `key` (relative to the root) relative to these rules."""
+        if not self.base:
+            return key
+        return key[len(self.base) + 1:]
+    
+    def hides_contents(self, key):
+        """Whether these rules ignore every entry inside the directory `key` (relative to the root)."""
+        return self.contents_regex is not None and self.contents_regex.fullmatch(self.relative_dir(key)) is not None
+    
+    def match(self, rel_dir, name, is_dir):
+        """Return True if the entry is ignored, False if re-included, None if no pattern applies."""
+        path = f"{rel_dir}/{name}" if rel_dir else name
+        for regex, negate, dir_only, anchored in reversed(self.ordered):
+            if dir_only and not is_dir:
+                continue
+            if regex.fullmatch(path if anchored else name):
+                return not negate
+        return None
+    
+    def keep(self, rel_dir, names, is_dir):
+        """Return the names these rules do not ignore; only valid without negated patterns."""
+        excluded = self.dir_names if is_dir else self.names
+        if excluded:
+            names = [name for name in names if name not in excluded]
+        regex = self.dir_name_regex if is_dir else self.name_regex
+        if regex is not None:
+            names = [name for name in names if not regex.fullmatch(name)]
+        regex = self.dir_path_regex if is_dir else self.path_regex
+        if regex is not None:
+            names = [name for name in names
+                     if not regex.fullmatch(f"{rel_dir}/{name}" if rel_dir else name)]
+        return names
+
+def _parse_pattern(pattern):
+    """
+    Parse one .gitignore line.
+    
     Returns:
-        str: The formatted tree structure
+        tuple: (regex, negate, dir_only, anchored, literal name or None), or None for blanks and comments
     """
-    if ignore_dirs is None:
-        ignore_dirs = ['.git', '__pycache__', 'venv', 'env', '.venv', 'node_modules']
+    pattern = pattern.rstrip('\r\n')
+    if not pattern or pattern.startswith('#'):
+        return None
+    # Trailing spaces are dropped unless escaped with a backslash
+    stripped = pattern.rstrip(' ')
+    if stripped.endswith('\\') and len(stripped) < len(pattern):
+        stripped += ' '
+    pattern = stripped
     
-    output = []
+    negate = pattern.startswith('!')
+    if negate:
+        pattern = pattern[1:]
+    elif pattern.startswith(('\\!', '\\#')):
+        pattern = pattern[1:]
     
-    # Add the directory name
-    base_name = os.path.basename(directory)
-    if prefix == "":
-        # Root directory
-        output.append(f"{base_name}/")
-        new_prefix = ""
-    else:
-        # Non-root directory
-        if is_last:
-            output.append(f"{prefix}└── {base_name}/")
-            new_prefix = prefix + "    "
+    dir_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    if not pattern:
+        return None
+    # A slash anywhere but the end ties the pattern to the ignore file's directory
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    
+    literal = None if any(c in pattern for c in '*?[\\') else pattern
+    return _glob_to_regex(pattern), negate, dir_only, anchored, literal
+
+def _glob_to_regex(pattern):
+    """Translate a .gitignore glob into a regular expression matched against a whole path."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i) and (i == 0 or pattern[i - 1] == '/'):
+            # Zero or more whole directories
+            out.append('(?:.*/)?')
+            i += 3
+            continue
+        if pattern.startswith('**', i) and i + 2 == n and (i == 0 or pattern[i - 1] == '/'):
+            # Everything inside
+            out.append('.*')
+            i += 2
+            continue
+        if c == '*':
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                out.append('\\[')
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                out.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
         else:
-            output.append(f"{prefix}├── {base_name}/")
-            new_prefix = prefix + "│   "
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+def command_line_rules(ignore_dirs):
+    """
+    Compile the default and --ignore patterns, which apply from the root down.
+    
+    A plain name only ignores directories of that name, as it always has;
+    anything with a glob character or a slash is a .gitignore pattern.
+    """
+    patterns = []
+    for pattern in ignore_dirs:
+        pattern = pattern.strip()
+        if pattern and not any(c in pattern for c in '*?[/!\\'):
+            pattern += '/'
+        patterns.append(pattern)
+    return IgnoreRules("", patterns)
+
+def read_gitignore(parent, name, key, shared=None):
+    """
+    Compile the .gitignore inside a directory.
+    
+    Args:
+        parent: Handle of the directory's parent, or None for the root
+        name (str): The directory name (the full path for the root)
+        key (str): Path of the directory relative to the root
+        shared (_SharedView): Files already read by another walk of this run
+    
+    Returns:
+        IgnoreRules: The compiled rules, or None if the file cannot be read
+    """
+    lines = shared.ignore_file(key) if shared is not None else None
+    if lines is None:
+        try:
+            path, dir_fd = _at(parent, name)
+            fd = os.open(os.path.join(path, '.gitignore'), os.O_RDONLY, dir_fd=dir_fd)
+            with open(fd, 'r', encoding='utf-8', errors='replace') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+        if shared is not None:
+            shared.store_ignore_file(key, lines)
+    return IgnoreRules(key, lines)
+
+def filter_entries(scope, key, dirs, files):
+    """
+    Drop the entries of one directory that any rules in scope ignore.
+    
+    Args:
+        scope (tuple): IgnoreRules from the root down to this directory
+        key (str): Path of the directory relative to the root
+        dirs (list): Subdirectory names
+        files (list): File names
+    
+    Returns:
+        tuple: (dirs, files) with ignored entries removed
+    """
+    if all(rules.ordered is None for rules in scope):
+        # Without negations an entry is ignored as soon as any pattern matches
+        for rules in scope:
+            rel_dir = rules.relative_dir(key) if rules.uses_paths else ""
+            dirs = rules.keep(rel_dir, dirs, True)
+            files = rules.keep(rel_dir, files, False)
+        return dirs, files
+    
+    rel_dirs = [rules.relative_dir(key) if rules.uses_paths else "" for rules in scope]
+    
+    # Command-line patterns come first, then the deepest ignore file with an opinion
+    order = [0] + list(range(len(scope) - 1, 0, -1))
+    
+    def ignored(name, is_dir):
+        for position in order:
+            rules, rel_dir = scope[position], rel_dirs[position]
+            if rules.ordered is None:
+                matched = True if not rules.keep(rel_dir, [name], is_dir) else None
+            else:
+                matched = rules.match(rel_dir, name, is_dir)
+            if matched is not None:
+                return matched
+        return False
+    
+    return ([name for name in dirs if not ignored(name, True)],
+            [name for name in files if not ignored(name, False)])
+
+class ScanCache:
+    """
+    On-disk cache of directory listings keyed on each directory's mtime.
+    
+    A directory whose mtime still matches its cached entry is not listed
+    again, and is not even opened when it has no subdirectories to descend
+    into. Listings are stored before ignore rules are applied, so the same
+    cache serves any --ignore list. A cached .gitignore is still read on
+    every run, since editing it does not change its directory's mtime.
+    """
+    VERSION = 3
+    
+    # Directories modified this recently may change again without their
+    # mtime moving on coarse-grained filesystems, so they are never cached
+    RACY_WINDOW_NS = 2_000_000_000
+    
+    def __init__(self, path, load=True):
+        self.path = path
+        self.entries = {}
+        self.updated = {}
+        self.dirty = not load
+        # time.time_ns needs Python 3.7; to the nearest microsecond is close
+        # enough against RACY_WINDOW_NS
+        self.started_ns = int(time.time() * 1e9)
+        if load:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == self.VERSION:
+                    self.entries = data['entries']
+            except (OSError, ValueError, KeyError):
+                pass
+    
+    @staticmethod
+    def default_path(root_dir):
+        """Return the cache file used for root_dir under the user's cache directory."""
+        cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        digest = hashlib.sha1(os.path.abspath(root_dir).encode('utf-8', 'surrogateescape')).hexdigest()
+        return os.path.join(cache_home, 'structure', f"{digest[:16]}.json")
+    
+    def lookup(self, key, mtime_ns):
+        """Return the cached listing for a directory, as scan_directory would, if its mtime is unchanged."""
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == mtime_ns:
+            self.updated[key] = entry
+            return entry[1], entry[2], entry[3], entry[4], None
+        return None
+    
+    def store(self, key, mtime_ns, dirs, files, has_gitignore, links):
+        """Record a fresh listing for a directory."""
+        self.dirty = True
+        if mtime_ns < self.started_ns - self.RACY_WINDOW_NS:
+            self.updated[key] = [mtime_ns, dirs, files, has_gitignore, links]
+    
+    def save(self):
+        """
+        Write the listings seen during this run, dropping directories that are gone.
+        
+        Failing to write the cache is not an error; the next run just scans again.
+        """
+        if not self.dirty and len(self.updated) == len(self.entries):
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.VERSION, 'entries': self.updated}, f, separators=(',', ':'))
+            os.replace(temp_path, self.path)
+        except OSError:
+            pass
+
+class SharedListings:
+    """
+    Directory listings shared by the walks of one run over several roots.
+    
+    When roots overlap, such as a monorepo and the packages inside it, a
+    directory under more than one of them is listed (and its .gitignore
+    read) by the first walk to reach it, and reused by the others. Only
+    directories under more than one root are kept, so roots that do not
+    overlap cost nothing extra. Like ScanCache, listings are kept before
+    ignore rules are applied, so each walk still filters them its own way.
+    """
+    
+    def __init__(self, roots):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.listings = {}
+        self.ignore_files = {}
+        self.rules = {}
+    
+    def command_line_rules(self, ignore_dirs):
+        """command_line_rules(ignore_dirs), compiled once per run."""
+        key = tuple(ignore_dirs)
+        rules = self.rules.get(key)
+        if rules is None:
+            rules = self.rules[key] = command_line_rules(ignore_dirs)
+        return rules
+    
+    def view(self, directory, flags):
+        """
+        The listings as seen from one root, keyed on paths relative to it.
+        
+        Args:
+            directory (str): The root being walked
+            flags (tuple): The scan_directory options the walk lists with
+        
+        Returns:
+            _SharedView: The view, or None if no other root overlaps this one
+        """
+        root = os.path.abspath(directory)
+        share_all = False
+        nested = set()
+        seen_self = False
+        for other in self.roots:
+            if other == root and not seen_self:
+                seen_self = True
+            elif root == other or root.startswith(other.rstrip(os.sep) + os.sep):
+                # Another root contains this one, so every directory is shared
+                share_all = True
+            elif other.startswith(root.rstrip(os.sep) + os.sep):
+                nested.add(os.path.relpath(other, root).replace(os.sep, '/'))
+        if not share_all and not nested:
+            return None
+        return _SharedView(self, root, flags, share_all, nested)
+
+class _SharedView:
+    """SharedListings for the walk of one root."""
+    __slots__ = ('shared', 'root', 'flags', 'share_all', 'nested')
+    
+    def __init__(self, shared, root, flags, share_all, nested):
+        self.shared = shared
+        self.root = root
+        self.flags = flags
+        self.share_all = share_all
+        self.nested = nested
+    
+    def keeps(self, key):
+        """Whether the directory at `key` is under another root as well."""
+        if self.share_all:
+            return True
+        position = key.find('/')
+        while position != -1:
+            if key[:position] in self.nested:
+                return True
+            position = key.find('/', position + 1)
+        return key in self.nested
     
-    # List all items in the directory
+    def _path(self, key):
+        return os.path.join(self.root, key.replace('/', os.sep)) if key else self.root
+    
+    def lookup(self, key):
+        """Return (mtime_ns or None, listing) for a directory another walk has listed, or None."""
+        if not self.keeps(key):
+            return None
+        return self.shared.listings.get((self.flags, self._path(key)))
+    
+    def store(self, key, mtime_ns, listing):
+        if self.keeps(key):
+            self.shared.listings[(self.flags, self._path(key))] = (mtime_ns, listing)
+    
+    def ignore_file(self, key):
+        """The lines of a .gitignore another walk has read, or None."""
+        if not self.keeps(key):
+            return None
+        return self.shared.ignore_files.get(self._path(key))
+    
+    def store_ignore_file(self, key, lines):
+        if self.keeps(key):
+            self.shared.ignore_files[self._path(key)] = lines
+
+class _Frame:
+    """One open directory on the traversal stack."""
+    __slots__ = ('handle', 'dirs', 'files', 'links', 'stats', 'more', 'index', 'depth', 'futures', 'key', 'scope',
+                 'error', 'node', 'total', 'count', 'parent', 'ident')
+    
+    def __init__(self, handle, dirs, files, key, scope, error=None, more=0, stats=None, links=()):
+        self.handle = handle
+        self.dirs = dirs
+        self.files = files
+        self.links = links
+        self.stats = stats
+        self.more = more
+        # The directory's node, and the sizes and number of files listed below it
+        self.node = None
+        self.total = 0
+        self.count = 0
+        self.index = 0
+        self.depth = 0
+        self.futures = []
+        self.key = key
+        self.scope = scope
+        self.error = error
+        # The frame of the directory above, and (st_dev, st_ino) once a symlink needs it
+        self.parent = None
+        self.ident = None
+    
+    def remaining(self):
+        """Number of entries in this directory not yet output."""
+        return len(self.dirs) - self.index + len(self.files) + self.more
+    
+    def close(self):
+        """Release the directory descriptor, if one is held."""
+        if isinstance(self.handle, int):
+            os.close(self.handle)
+        self.handle = None
+
+def _at(parent, name):
+    """Return (path, dir_fd) for an os call on `name` inside the directory handle `parent`."""
+    if isinstance(parent, int):
+        return name, parent
+    return (name if parent is None else os.path.join(parent, name)), None
+
+def _open_handle(parent, name, path=None):
+    """
+    Return a handle for listing a directory: a descriptor where supported, else its path.
+    
+    With no descriptor left in the process, the directory's full `path` is
+    returned instead, if one is given.
+    """
+    target, dir_fd = _at(parent, name)
+    if not USE_DIR_FD:
+        return target
     try:
-        items = sorted([item for item in os.listdir(directory) 
-                      if not item.startswith('.') or item == '.env.example'])
+        return os.open(target, os.O_RDONLY | os.O_DIRECTORY, dir_fd=dir_fd)
+    except OSError as e:
+        if e.errno != errno.EMFILE or path is None:
+            raise
+        return path
+
+def _scan_handle(handle, path, with_stats, stat_dirs):
+    """
+    scan_directory on a handle from _open_handle, by path if listing the descriptor needs one too many.
+    
+    Returns:
+        tuple: (listing from scan_directory, the handle it was made through)
+    """
+    try:
+        return scan_directory(handle, with_stats, stat_dirs), handle
+    except OSError as e:
+        # os.scandir lists a copy of the descriptor
+        if e.errno != errno.EMFILE or path is None or not isinstance(handle, int):
+            raise
+    os.close(handle)
+    return scan_directory(path, with_stats, stat_dirs), path
+
+def _open_frame(parent, name, key, scope, use_gitignore, max_children=None, with_stats=False, stat_dirs=True, cache=None,
+                shared=None, root=None):
+    """
+    Open and list one directory as a traversal stack frame.
+    
+    Args:
+        parent: Handle of the parent directory, or None for the root
+        name (str): The directory name (the full path for the root)
+        key (str): Path of the directory relative to the root
+        scope (tuple): IgnoreRules inherited from the directories above
+        use_gitignore (bool): Whether to read this directory's .gitignore
+        max_children (int): Most entries to keep; the rest are only counted
+        with_stats (bool): Whether to collect the size and mtime of every entry
+        stat_dirs (bool): With with_stats, whether directories are stat'ed as well as files
+        cache (ScanCache): Listings to reuse for unchanged directories
+        shared (_SharedView): Listings made by other walks of this run
+        root (str): The directory being mapped, to list by path if out of descriptors
+    
+    Returns:
+        _Frame: The listed directory, or one carrying the error that stopped it
+    """
+    path = None if root is None else os.path.join(root, key) if key else root
+    handle = None
+    try:
+        listing = None
+        if shared is not None:
+            # Another root of this run has listed the directory already
+            memo = shared.lookup(key)
+            if memo is not None:
+                mtime_ns, listing = memo
+                # Keep it in this root's own scan cache as well
+                if cache is not None and mtime_ns is not None and cache.lookup(key, mtime_ns) is None:
+                    cache.store(key, mtime_ns, *listing[:4])
         
-        # Filter out ignored directories
-        filtered_items = []
-        for item in items:
-            item_path = os.path.join(directory, item)
-            if os.path.isdir(item_path) and item in ignore_dirs:
-                continue
-            filtered_items.append(item)
+        if listing is None:
+            mtime_ns = None
+            if cache is not None:
+                # Stat before listing, so a change made mid-scan is picked up next run
+                target, dir_fd = _at(parent, name)
+                mtime_ns = os.stat(target, dir_fd=dir_fd).st_mtime_ns
+                listing = cache.lookup(key, mtime_ns)
+            
+            if listing is None:
+                handle = _open_handle(parent, name, path)
+                listing, handle = _scan_handle(handle, path, with_stats, stat_dirs)
+                if cache is not None:
+                    cache.store(key, mtime_ns, *listing[:4])
+            if shared is not None:
+                shared.store(key, mtime_ns, listing)
+        dirs, files, has_gitignore, links, stats = listing
         
-        # Process directories first, then files
-        dirs = [item for item in filtered_items if os.path.isdir(os.path.join(directory, item))]
-        files = [item for item in filtered_items if not os.path.isdir(os.path.join(directory, item))]
+        # Rules from this directory's .gitignore apply here and below
+        if use_gitignore and has_gitignore:
+            rules = read_gitignore(parent, name, key, shared)
+            if rules is not None:
+                scope = scope + (rules,)
+        dirs, files = filter_entries(scope, key, dirs, files)
         
-        all_items = dirs + files
+        # Entries past the limit are counted but never opened
+        more = 0
+        if max_children is not None and len(dirs) + len(files) > max_children:
+            more = len(dirs) + len(files) - max_children
+            files = files[:max(0, max_children - len(dirs))]
+            dirs = dirs[:max_children]
         
-        for i, item in enumerate(all_items):
-            item_path = os.path.join(directory, item)
-            is_current_last = (i == len(all_items) - 1)
+        # A cached directory only needs opening to reach its subdirectories
+        if handle is None and dirs:
+            handle = _open_handle(parent, name, path)
+    except PermissionError:
+        return _Frame(handle, [], [], key, scope, "Access Denied")
+    except Exception as e:
+        return _Frame(handle, [], [], key, scope, f"Error: {str(e)}")
+    
+    return _Frame(handle, dirs, files, key, scope, more=more, stats=stats, links=links)
+
+def _child_key(key, name):
+    """Path of a subdirectory relative to the root, given its parent's."""
+    return f"{key}/{name}" if key else name
+
+def _leads_back(directory, frame, name):
+    """Whether a symlinked subdirectory of a frame resolves to that directory or one above it."""
+    try:
+        st = os.stat(os.path.join(directory, _child_key(frame.key, name)))
+    except OSError:
+        return False
+    target = (st.st_dev, st.st_ino)
+    while frame is not None:
+        if frame.ident is None:
+            try:
+                st = os.stat(os.path.join(directory, frame.key) if frame.key else directory)
+                frame.ident = (st.st_dev, st.st_ino)
+            except OSError:
+                frame.ident = ()
+        if frame.ident == target:
+            return True
+        frame = frame.parent
+    return False
+
+def iter_tree(directory, ignore_dirs=None, jobs=1, cache=None, use_gitignore=True,
+              max_depth=None, max_entries=None, max_children=None, with_stats=False, sizes=False, shared=None):
+    """
+    Walk the directory and yield one node per output line as it is reached.
+    
+    The walk uses an explicit stack rather than recursion, so tree depth is
+    not bounded by the interpreter's recursion limit. Every line in a
+    directory shares one prefix string, extended by a segment on the way
+    down and trimmed on the way back up.
+    
+    Ignored directories are dropped from their parent's listing, so they are
+    never opened. With use_gitignore, each directory's .gitignore applies to
+    everything below it, on top of ignore_dirs.
+    
+    The limits cut the walk short rather than filtering its output: nothing
+    is listed below max_depth, a directory's entries past max_children are
+    never opened, and the walk stops once max_entries lines are out. Each cut
+    leaves a "… N more" line where the entries would have been.
+    
+    With more than one job, subdirectories are listed ahead of the walk on a
+    thread pool. Lines are still produced by this generator alone, so the
+    order is the same as a single-threaded walk.
+    
+    Walks of several roots in one run can pass the same SharedListings, so
+    directories under more than one of the roots are only listed once.
+    
+    Args:
+        directory (str): The directory to map
+        ignore_dirs (list): Directory names or .gitignore-style patterns to ignore
+        jobs (int): Number of threads listing directories
+        cache (ScanCache): Listings to reuse for directories whose mtime is unchanged
+        use_gitignore (bool): Whether to honour .gitignore files
+        max_depth (int): Levels below the root to list
+        max_entries (int): Entries to output before stopping
+        max_children (int): Entries to output per directory
+        with_stats (bool): Whether to fill in the size and mtime of every node
+        sizes (bool): Whether to total the file sizes and counts of every directory
+        shared (SharedListings): Listings and ignore rules shared with other walks of this run
+    
+    Yields:
+        Node: One node per output line, in display order
+    """
+    if ignore_dirs is None:
+        ignore_dirs = DEFAULT_IGNORE_DIRS
+    if with_stats or sizes:
+        # File sizes and mtimes change without touching their directory's mtime
+        cache = None
+    scan_stats = with_stats or sizes
+    view = None
+    if shared is not None:
+        view = shared.view(directory, (scan_stats, with_stats))
+        root_rules = shared.command_line_rules(ignore_dirs)
+    else:
+        root_rules = command_line_rules(ignore_dirs)
+    
+    # The root line goes out before anything is listed
+    root_stat = None
+    if with_stats:
+        try:
+            st = os.stat(directory)
+            root_stat = (st.st_size, st.st_mtime)
+        except OSError:
+            pass
+    root = Node(os.path.basename(directory), 'dir', 0, True, "", "", root_stat)
+    yield root
+    if max_depth is not None and max_depth < 1:
+        return
+    
+    executor = ThreadPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    # Bound how far the listings may run ahead of the output
+    lookahead = jobs * 4
+    outstanding = 0
+    
+    def open_child(frame, index):
+        name = frame.dirs[index]
+        key = _child_key(frame.key, name)
+        if frame.scope[0].hides_contents(key):
+            # Nothing inside could be listed, so the directory is not even opened;
+            # the command-line rules come first, so no ignore file can re-include it
+            child = _Frame(None, [], [], key, frame.scope)
+        elif name in frame.links and _leads_back(directory, frame, name):
+            # Following this symlink would walk the same directories forever
+            child = _Frame(None, [], [], key, frame.scope, "Symlink loop")
+        else:
+            child = _open_frame(frame.handle, name, key, frame.scope, use_gitignore,
+                                max_children, scan_stats, with_stats, cache, view, directory)
+        child.depth = frame.depth + 1
+        child.parent = frame
+        return child
+    
+    def roll_up(frame, parent):
+        """Record a finished directory's totals on its node and add them to its parent's."""
+        if frame.node is None or frame.error is not None:
+            return
+        frame.node.total_size = frame.total
+        frame.node.file_count = frame.count
+        if parent is not None:
+            parent.total += frame.total
+            parent.count += frame.count
+    
+    def descends(frame):
+        """Whether the subdirectories of a frame are listed at all."""
+        return max_depth is None or frame.depth + 1 < max_depth
+    
+    # Frames on the stack holding a descriptor, from the top of the tree down
+    held = []
+    
+    def busy(frame):
+        """Whether listings of a frame's subdirectories are still running on its descriptor."""
+        return any(not future.done() for future in frame.futures[frame.index:])
+    
+    def trim():
+        """Release descriptors down to seven eighths of MAX_OPEN_DIRS, once more than that are held."""
+        if len(held) <= MAX_OPEN_DIRS:
+            return
+        # Release those whose loss leaves the smallest gaps between the ones
+        # left, so every directory stays a few steps below a held one. No two
+        # neighbours go at once, and the topmost and deepest are kept.
+        depths = [frame.depth for frame in held]
+        gaps = [below - above for above, below in zip(depths, depths[2:])]
+        wanted = len(held) - MAX_OPEN_DIRS + MAX_OPEN_DIRS // 8
+        victims = set()
+        for i in sorted(range(len(gaps)), key=gaps.__getitem__):
+            if i - 1 in victims or i + 1 in victims or (executor is not None and busy(held[i + 1])):
+                continue
+            victims.add(i)
+            if len(victims) == wanted:
+                break
+        for i in sorted(victims, reverse=True):
+            held.pop(i + 1).close()
+    
+    def hold(frame):
+        """Count the descriptor of a frame just pushed on the stack."""
+        if isinstance(frame.handle, int):
+            held.append(frame)
+            trim()
+    
+    def release(frame):
+        """Close a frame's descriptor and stop counting it."""
+        if held and held[-1] is frame:
+            held.pop()
+        elif frame in held:
+            held.remove(frame)
+        frame.close()
+    
+    def reopen(frame):
+        """Open a released descriptor again, relative to the nearest directory above that holds one."""
+        steps = []
+        above = frame
+        while above is not None and not isinstance(above.handle, int):
+            steps.append(above)
+            above = above.parent
+        parent = None if above is None else above.handle
+        position = 0 if above is None else held.index(above) + 1
+        passed = None
+        try:
+            for step in reversed(steps):
+                handle = os.open(step.key.rsplit('/', 1)[-1] if step.key else directory,
+                                 os.O_RDONLY | os.O_DIRECTORY, dir_fd=parent)
+                if passed is not None:
+                    os.close(passed)
+                    passed = None
+                # Directories on the way with subdirectories left to open keep theirs
+                # as well, as the deepest held for now, so trimming keeps this one
+                if step is frame or step.index < len(step.dirs):
+                    step.handle = handle
+                    held.insert(position, step)
+                    trim()
+                    position = len(held)
+                else:
+                    passed = handle
+                parent = handle
+        except OSError:
+            # Moved since it was listed, or out of descriptors: go by path instead
+            frame.handle = os.path.join(directory, frame.key) if frame.key else directory
+        finally:
+            if passed is not None:
+                os.close(passed)
+    
+    def prefetch(frame, required=-1):
+        """Queue listings of a frame's subdirectories, always including index `required`."""
+        nonlocal outstanding
+        if not descends(frame):
+            return
+        futures = frame.futures
+        if len(futures) < len(frame.dirs) and frame.handle is None:
+            reopen(frame)
+        while len(futures) < len(frame.dirs) and (outstanding < lookahead or len(futures) <= required):
+            futures.append(executor.submit(open_child, frame, len(futures)))
+            outstanding += 1
+    
+    prefix = ""
+    emitted = 0
+    stack = [_open_frame(None, directory, "", (root_rules,), use_gitignore, max_children,
+                         scan_stats, with_stats, cache, view, directory)]
+    stack[0].node = root
+    hold(stack[0])
+    if executor is not None:
+        prefetch(stack[0])
+    try:
+        while stack:
+            frame = stack[-1]
+            dirs = frame.dirs
+            files = frame.files
+            index = frame.index
             
-            if os.path.isdir(item_path):
-                # It's a directory, recurse into it
-                output.extend(generate_tree(item_path, new_prefix, is_current_last, ignore_dirs))
-            else:
-                # It's a file
-                if is_current_last:
-                    output.append(f"{new_prefix}└── {item}")
+            # Process directories first, descending into each one
+            if index < len(dirs):
+                if emitted == max_entries:
+                    break
+                emitted += 1
+                frame.index = index + 1
+                is_last = index == len(dirs) - 1 and not files and not frame.more
+                name = dirs[index]
+                node = Node(name, 'dir', frame.depth + 1, is_last, frame.key, prefix,
+                            frame.stats.get(name) if frame.stats else None)
+                yield node
+                
+                if not descends(frame):
+                    continue
+                if executor is None:
+                    if frame.handle is None:
+                        reopen(frame)
+                    child = open_child(frame, index)
                 else:
-                    output.append(f"{new_prefix}├── {item}")
+                    prefetch(frame, index)
+                    child = frame.futures[index].result()
+                    frame.futures[index] = None
+                    outstanding -= 1
+                # The parent descriptor is only needed to open subdirectories
+                if index == len(dirs) - 1:
+                    release(frame)
+                child.node = node
+                stack.append(child)
+                hold(child)
+                prefix += "    " if is_last else "│   "
+                if executor is not None:
+                    prefetch(child)
+                continue
+            
+            # Then the files, after which the directory is finished
+            depth = frame.depth + 1
+            stats = frame.stats
+            if frame.error is not None:
+                yield Node(frame.error, 'error', depth, True, frame.key, prefix)
+            elif files:
+                count = len(files)
+                if max_entries is not None and count > max_entries - emitted:
+                    # The entry limit runs out inside this directory
+                    count = max_entries - emitted
+                    frame.more += len(files) - count
+                emitted += count
+                if sizes:
+                    for i in range(count):
+                        stat = stats.get(files[i])
+                        if stat is not None:
+                            frame.total += stat[0]
+                            frame.count += 1
+                last_index = len(files) - 1
+                for i in range(min(count, last_index)):
+                    name = files[i]
+                    yield Node(name, 'file', depth, False, frame.key, prefix, stats.get(name) if stats else None)
+                if count == len(files):
+                    name = files[last_index]
+                    yield Node(name, 'file', depth, not frame.more, frame.key, prefix,
+                               stats.get(name) if stats else None)
+                frame.files = ()
+            
+            if frame.more:
+                yield Node(f"… {frame.more} more", 'more', depth, True, frame.key, prefix)
+                frame.more = 0
+            release(stack.pop())
+            if sizes:
+                roll_up(frame, stack[-1] if stack else None)
+            prefix = prefix[:-4]
+        
+        # Out of entries: note what is left at each level still open
+        for depth, frame in enumerate(reversed(stack)):
+            remaining = frame.remaining()
+            if remaining:
+                yield Node(f"… {remaining} more", 'more', frame.depth + 1, True, frame.key,
+                           prefix[:len(prefix) - 4 * depth])
+        if sizes:
+            for i in range(len(stack) - 1, -1, -1):
+                roll_up(stack[i], stack[i - 1] if i else None)
+    finally:
+        if executor is not None:
+            # Stop queued listings and release the ones that finished unused
+            for frame in stack:
+                for future in frame.futures:
+                    if future is not None:
+                        future.cancel()
+            executor.shutdown(wait=True)
+            for frame in stack:
+                for future in frame.futures:
+                    if future is not None and not future.cancelled():
+                        future.result().close()
+        for frame in stack:
+            frame.close()
+
+def render_line(node, show_sizes=False):
+    """Format a node from iter_tree as a line of the tree, optionally followed by its size."""
+    if node.kind == 'dir':
+        line = f"{node.prefix}{node.connector}{node.name}/"
+    else:
+        line = f"{node.prefix}{node.connector}{node.name}"
+    if show_sizes:
+        return line + size_label(node)
+    return line
+
+def size_label(node):
+    """The size annotation shown after a node with --sizes, or "" if it has none."""
+    if node.file_count is not None:
+        files = "file" if node.file_count == 1 else "files"
+        return f"  ({format_size(node.total_size)}, {node.file_count} {files})"
+    if node.kind == 'file' and node.size is not None:
+        return f"  ({format_size(node.size)})"
+    return ""
+
+def format_size(size):
+    """Format a byte count for display, e.g. 512 B, 1.5 KB, 20.3 MB."""
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if size < 1024 or unit == 'TB':
+            return f"{size} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+def _json_lines(nodes):
+    """Yield a nested JSON document for the nodes, one line per node."""
+    # One flag per open "children" array: whether its directory is the last entry
+    open_dirs = []
+    for node in nodes:
+        while len(open_dirs) > node.depth:
+            yield "]}" if open_dirs.pop() else "]},"
+        text = json.dumps(node.record(), ensure_ascii=False)
+        if node.kind == 'dir':
+            open_dirs.append(node.is_last)
+            yield text[:-1] + ', "children": ['
+        else:
+            yield text if node.is_last else text + ","
+    while open_dirs:
+        yield "]}" if open_dirs.pop() else "]},"
+
+def _ndjson_lines(nodes):
+    """Yield one self-contained JSON object per node."""
+    for node in nodes:
+        record = {'path': node.path, 'depth': node.depth}
+        record.update(node.record())
+        yield json.dumps(record, ensure_ascii=False)
+
+# Output formats other than the ASCII tree, each turning nodes into lines
+EXPORTERS = {
+    'json': _json_lines,
+    'ndjson': _ndjson_lines,
+}
+
+def generate_tree(directory, ignore_dirs=None):
+    """
+    Generate a tree structure for the given directory.
     
-    except PermissionError:
-        output.append(f"{new_prefix}├── Access Denied")
-    except Exception as e:
-        output.append(f"{new_prefix}├── Error: {str(e)}")
+    Args:
+        directory (str): The directory to map
+        ignore_dirs (list): List of directory names to ignore
+        
+    Returns:
+        list: The formatted tree structure, one line per entry
+    """
+    return [render_line(node) for node in iter_tree(directory, ignore_dirs)]
+
+def write_lines(stream, lines, end=''):
+    """Write lines to a stream as they are produced, newline-separated, then `end`."""
+    first = True
+    for line in lines:
+        if not first:
+            stream.write('\n')
+        stream.write(line)
+        first = False
+    stream.write(end)
+
+def read_manifest(path):
+    """
+    Read the directories listed in a manifest file, one per line.
     
-    return output
+    Blank lines and lines starting with # are skipped. A path of - reads
+    the list from standard input.
+    
+    Returns:
+        list: The directories, in the order listed
+    """
+    if path == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith('#')]
+
+def batch_output_paths(roots, output_file, output_dir):
+    """
+    The output file of each root for --output-dir.
+    
+    Each root's tree goes to a file named like output_file, at the root's
+    path relative to the roots' common parent under output_dir.
+    """
+    paths = [os.path.abspath(root) for root in roots]
+    common = os.path.commonpath(paths)
+    name = os.path.basename(output_file)
+    return [os.path.join(output_dir, os.path.relpath(path, common), name) for path in paths]
+
+def _named_root(nodes, name):
+    """Yield the nodes of a walk with the root line showing `name`."""
+    nodes = iter(nodes)
+    root = next(nodes)
+    root.name = name
+    yield root
+    yield from nodes
 
 def main():
     """
     Main function to generate a directory structure and save it to a file.
+    
+    Positional arguments are the directory, the output file and a comma-separated
+    list of extra directories or .gitignore-style patterns to ignore. Options may
+    follow them:
+    
+        --root DIR       Map DIR as well; may be given more than once
+        --manifest FILE  Map every directory listed in FILE, one per line
+                         (- reads the list from standard input)
+        --output-dir DIR With several directories, write each tree to its
+                         own file under DIR instead of all to the output file
+        -j, --jobs N     List directories on N threads (default: 1)
+        --no-gitignore   Do not apply .gitignore files
+        --max-depth N    List at most N levels below the directory
+        --max-entries N  Stop after N entries
+        --max-children N Show at most N entries per directory
+        --format FORMAT  ascii (default), json or ndjson; the JSON formats
+                         include each entry's size and mtime
+        --sizes          Show file sizes, and each directory's total size and
+                         file count (the tree is written once the walk ends)
+        --no-cache       Neither read nor write the scan cache
+        --clear-cache    Discard the scan cache and rebuild it from a full scan
+    
+    Several directories are walked in one process, sharing the compiled
+    ignore patterns and the listings of directories they have in common.
+    Written to one output file, their trees follow one another (as an
+    array with --format json), each with its root line showing the
+    directory as given.
     """
-    # Get the directory to map
-    if len(sys.argv) > 1:
-        root_dir = sys.argv[1]
-    else:
-        root_dir = os.getcwd()
+    # Separate the options from the positional arguments
+    positional = []
+    jobs = 1
+    use_cache = True
+    clear_cache = False
+    use_gitignore = True
+    limits = {}
+    output_format = 'ascii'
+    sizes = False
+    extra_roots = []
+    manifests = []
+    output_dir = None
+    args = sys.argv[1:]
+    i = 0
+    while i < len(args):
+        if args[i] in ["-j", "--jobs"] and i + 1 < len(args):
+            jobs = max(1, int(args[i + 1]))
+            i += 2
+        elif args[i] == "--no-cache":
+            use_cache = False
+            i += 1
+        elif args[i] == "--clear-cache":
+            clear_cache = True
+            i += 1
+        elif args[i] == "--no-gitignore":
+            use_gitignore = False
+            i += 1
+        elif args[i] in ["--max-depth", "--max-entries", "--max-children"] and i + 1 < len(args):
+            limits[args[i][2:].replace('-', '_')] = max(0, int(args[i + 1]))
+            i += 2
+        elif args[i] == "--sizes":
+            sizes = True
+            i += 1
+        elif args[i] == "--format" and i + 1 < len(args):
+            output_format = args[i + 1]
+            i += 2
+        elif args[i] == "--root" and i + 1 < len(args):
+            extra_roots.append(args[i + 1])
+            i += 2
+        elif args[i] == "--manifest" and i + 1 < len(args):
+            manifests.append(args[i + 1])
+            i += 2
+        elif args[i] == "--output-dir" and i + 1 < len(args):
+            output_dir = args[i + 1]
+            i += 2
+        else:
+            positional.append(args[i])
+            i += 1
+    
+    if output_format != 'ascii' and output_format not in EXPORTERS:
+        print(f"Unknown format: {output_format} (expected ascii, json or ndjson)")
+        sys.exit(1)
+    
+    # Get the directories to map; an empty directory argument adds none
+    roots = positional[:1] if positional and positional[0] else []
+    roots += extra_roots
+    for manifest in manifests:
+        try:
+            roots += read_manifest(manifest)
+        except OSError as e:
+            print(f"Cannot read manifest {manifest}: {e.strerror}")
+            sys.exit(1)
+    if not roots:
+        roots = [os.getcwd()]
     
     # Get output file name
-    if len(sys.argv) > 2:
-        output_file = sys.argv[2]
+    if len(positional) > 1:
+        output_file = positional[1]
     else:
         output_file = "structure.txt"
     
     # Get custom ignore directories
-    if len(sys.argv) > 3 and sys.argv[3]:
-        custom_ignore = sys.argv[3].split(',')
-        ignore_dirs = ['.git', '__pycache__', 'venv', 'env', '.venv', 'node_modules'] + custom_ignore
+    if len(positional) > 2 and positional[2]:
+        custom_ignore = positional[2].split(',')
+        ignore_dirs = DEFAULT_IGNORE_DIRS + custom_ignore
     else:
-        ignore_dirs = ['.git', '__pycache__', 'venv', 'env', '.venv', 'node_modules']
+        ignore_dirs = DEFAULT_IGNORE_DIRS
     
-    # Generate the tree structure
-    tree_structure = generate_tree(root_dir, ignore_dirs=ignore_dirs)
+    batch = len(roots) > 1 or output_dir is not None
+    shared = SharedListings(roots) if len(roots) > 1 else None
+    if output_dir is not None:
+        outputs = batch_output_paths(roots, output_file, output_dir)
     
-    # Write to file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(tree_structure))
+    combined = None if output_dir is not None else open(output_file, 'w', encoding='utf-8')
+    try:
+        if combined is not None and batch and output_format == 'json':
+            combined.write('[\n')
+        for n, root_dir in enumerate(roots):
+            # Reuse listings of directories that have not changed since the last run
+            cache = None
+            if use_cache:
+                cache = ScanCache(ScanCache.default_path(root_dir), load=not clear_cache)
+            
+            # Generate the tree structure and write it out as it is walked
+            nodes = iter_tree(root_dir, ignore_dirs, jobs, cache, use_gitignore,
+                              with_stats=output_format != 'ascii', sizes=sizes, shared=shared, **limits)
+            if combined is not None and batch:
+                nodes = _named_root(nodes, root_dir.rstrip('/\\') or root_dir)
+            if sizes:
+                # Directory totals are only known once the walk has left the directory
+                nodes = list(nodes)
+            
+            if combined is None:
+                os.makedirs(os.path.dirname(outputs[n]), exist_ok=True)
+                f = open(outputs[n], 'w', encoding='utf-8')
+            else:
+                f = combined
+                if n > 0:
+                    f.write({'ascii': '\n\n', 'json': ',\n'}.get(output_format, ''))
+            try:
+                if output_format == 'ascii':
+                    write_lines(f, (render_line(node, sizes) for node in nodes))
+                else:
+                    # Documents in a combined JSON array are closed by the separator
+                    in_array = f is combined and batch and output_format == 'json'
+                    write_lines(f, EXPORTERS[output_format](nodes), end='' if in_array else '\n')
+            finally:
+                if f is not combined:
+                    f.close()
+            
+            if cache is not None:
+                cache.save()
+        if combined is not None and batch and output_format == 'json':
+            combined.write('\n]\n')
+    finally:
+        if combined is not None:
+            combined.close()
     
-    print(f"Directory structure has been saved to {output_file}")
+    if not batch:
+        print(f"Directory structure has been saved to {output_file}")
+    else:
+        print(f"Directory structures of {len(roots)} directories have been saved to {output_dir or output_file}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file